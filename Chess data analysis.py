@@ -1,12 +1,104 @@
+import argparse
 import csv
-import matplotlib.pyplot as plt
+import chess_plots
+import logging
+import numpy as np
 import os
 import math
+import shutil
+import sys
+
+# Progress messages; the pipeline of chess program copy.py shows them at its --log-level
+logger = logging.getLogger(__name__)
+
+METRICS = ["Variance", "IQR", "SD", "MAD"]
+
+# Columnar results: a <name>_results.columns folder with one .npy file per column
+COLUMNS_EXTENSION = ".columns"
+COLUMN_DTYPES = {"Position": np.int32, "Variance": np.float64, "SD": np.float64, "MAD": np.float64,
+                 "IQR": np.float64, "Depth": np.int16}
+
+def write_result_columns(path, rows):
+    """Writes result rows (position number, FEN, variance, SD, MAD, IQR[, depth]) as a columns folder.
+
+    Every column is a typed .npy file; the FENs are a fixed-width byte string column,
+    so they can be indexed without reading the others.
+    """
+    rows = [tuple(row) + (0,) * (7 - len(row)) for row in rows]
+    positions, fens, variances, sds, mads, iqrs, depths = zip(*rows) if rows else ([],) * 7
+    columns = {"Position": positions, "Variance": variances, "SD": sds, "MAD": mads, "IQR": iqrs, "Depth": depths}
+
+    # Write next to the target and swap it in, so a crash never leaves half a folder
+    temporary_path = path + ".tmp"
+    if os.path.exists(temporary_path):
+        shutil.rmtree(temporary_path)
+    os.makedirs(temporary_path)
+    for name, values in columns.items():
+        np.save(os.path.join(temporary_path, f"{name}.npy"), np.asarray(values, dtype=COLUMN_DTYPES[name]))
+    np.save(os.path.join(temporary_path, "FEN.npy"), np.asarray([fen.encode() for fen in fens], dtype=np.bytes_))
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(temporary_path, path)
+
+def read_result_columns(file_path):
+    """Returns {column: array} for a results columns folder or a _results.txt file.
+
+    Columns folders are memory-mapped, so nothing is copied until the values are used.
+    Text files are parsed into arrays; files written before the Depth column get depth 0.
+    """
+    if os.path.isdir(file_path):
+        names = list(COLUMN_DTYPES) + ["FEN"]
+        return {name: np.load(os.path.join(file_path, f"{name}.npy"), mmap_mode='r') for name in names}
+
+    rows = []
+    with open(file_path, mode='r') as file:
+        for row in csv.DictReader(file):
+            rows.append((int(row["Position Number"]), row[" FEN"].strip(), float(row[" Variance"]),
+                         float(row[" Standard Deviation"]), float(row[" MAD"]), float(row[" IQR"]),
+                         int(row.get(" Depth") or 0)))
+    positions, fens, variances, sds, mads, iqrs, depths = zip(*rows) if rows else ([],) * 7
+    columns = {"Position": positions, "Variance": variances, "SD": sds, "MAD": mads, "IQR": iqrs, "Depth": depths}
+    columns = {name: np.asarray(values, dtype=COLUMN_DTYPES[name]) for name, values in columns.items()}
+    columns["FEN"] = np.asarray([fen.encode() for fen in fens], dtype=np.bytes_)
+    return columns
+
+def is_results_file(folder_path, file_name):
+    """Tells whether a folder entry is a _results.txt file or a results columns folder.
+
+    A text file converted next to itself (see convert_results_folder) is skipped in favour
+    of its columns folder, so the game is not analysed twice.
+    """
+    if file_name.endswith(COLUMNS_EXTENSION):
+        return os.path.isdir(os.path.join(folder_path, file_name))
+    columns_folder = os.path.join(folder_path, os.path.splitext(file_name)[0] + COLUMNS_EXTENSION)
+    return file_name.endswith('.txt') and not os.path.isdir(columns_folder)
+
+def convert_results_folder(input_folder_path, output_folder_path=None):
+    """Converts every _results.txt file of a folder (e.g. Already done/) to a columns folder."""
+    output_folder_path = output_folder_path or input_folder_path
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+    files = sorted(f for f in os.listdir(input_folder_path) if f.endswith('.txt'))
+    for file_name in files:
+        columns = read_result_columns(os.path.join(input_folder_path, file_name))
+        rows = zip(columns["Position"].tolist(), [fen.decode() for fen in columns["FEN"]],
+                   *(columns[name].tolist() for name in ["Variance", "SD", "MAD", "IQR", "Depth"]))
+        output_path = os.path.join(output_folder_path, os.path.splitext(file_name)[0] + COLUMNS_EXTENSION)
+        write_result_columns(output_path, list(rows))
+        logger.info(f"Converted {file_name} to {output_path}")
+
 # Function to read data from CSV file and structure it
 def read_data_from_file(file_path):
     data = []
-    print(f"Reading data from {file_path}...")
+    logger.info(f"Reading data from {file_path}...")
     
+    if os.path.isdir(file_path):
+        columns = read_result_columns(file_path)
+        for position, variance, iqr, sd, mad in zip(*(columns[name].tolist() for name in ["Position"] + METRICS)):
+            data.append({"Position": position, "Variance": variance, "IQR": iqr, "SD": sd, "MAD": mad})
+        logger.info(f"Finished reading {len(data)} rows from {file_path}.")
+        return data
+
     with open(file_path, mode='r') as file:
         csv_reader = csv.DictReader(file)
         for row in csv_reader:
@@ -19,7 +111,7 @@ def read_data_from_file(file_path):
                 "MAD": float(row[" MAD"])
             })
     
-    print(f"Finished reading {len(data)} rows from {file_path}.")
+    logger.info(f"Finished reading {len(data)} rows from {file_path}.")
     return data
 
 def euclidean_distance_2d(P1, P2):
@@ -48,6 +140,76 @@ def find_critical_points(metric_data):
     
     return critical_points
 
+# Scalar check of one window, with the same arithmetic as find_critical_points
+def is_critical_window(metric_data, i, window=3):
+    points = [(i + k + 1, metric_data[i + k]) for k in range(window)]
+    if not all(points[k + 1][1] < points[k][1] for k in range(window - 1)):
+        return False
+    dist_first_to_last = euclidean_distance_2d(points[0], points[-1])
+    dist_sum = euclidean_distance_2d(points[0], points[1])
+    for k in range(1, window - 1):
+        dist_sum += euclidean_distance_2d(points[k], points[k + 1])
+    return dist_first_to_last < dist_sum
+
+# Function to find critical points in many series of many metrics at once
+def find_critical_points_many(series_by_metric, window=3):
+    """Vectorized find_critical_points over many games and metrics.
+
+    series_by_metric maps each metric to either a 2-D array (games x positions) or a
+    list of series of different lengths. Returns a dict mapping each metric to a list
+    with the critical points of every game, in the same format and order as
+    find_critical_points: (i, P_i, P_i+1, ..., P_i+window-1) for windows whose values
+    strictly decrease and whose straight first-to-last distance is shorter than the
+    path through all points. With window=3 the result is exactly find_critical_points.
+    """
+    if window < 3:
+        raise ValueError("A critical point needs a window of at least 3 positions")
+
+    critical_points_by_metric = {}
+    for metric, series in series_by_metric.items():
+        if isinstance(series, np.ndarray) and series.ndim == 2:
+            values = series.astype(np.float64)
+        else:
+            # Pad ragged series with NaN, which never compares as decreasing
+            series = list(series)
+            values = np.full((len(series), max((len(s) for s in series), default=0)), np.nan)
+            for g, metric_data in enumerate(series):
+                values[g, :len(metric_data)] = metric_data
+
+        games, positions = values.shape
+        critical_points = [[] for _ in range(games)]
+        critical_points_by_metric[metric] = critical_points
+        windows = positions - window + 1
+        if windows <= 0:
+            continue
+
+        with np.errstate(invalid='ignore'):
+            # Condition 1: every point lower than the previous one
+            steps_down = values[:, 1:] < values[:, :-1]
+            decreasing = steps_down[:, :windows].copy()
+            for k in range(1, window - 1):
+                decreasing &= steps_down[:, k:k + windows]
+
+            # Condition 2: straight distance shorter than the path, summed in the same order
+            segments = np.sqrt(1 + np.diff(values, axis=1) ** 2)
+            dist_sum = segments[:, :windows].copy()
+            for k in range(1, window - 1):
+                dist_sum += segments[:, k:k + windows]
+            dist_first_to_last = np.sqrt((window - 1) ** 2 + (values[:, window - 1:] - values[:, :windows]) ** 2)
+
+        critical = decreasing & (dist_first_to_last < dist_sum)
+        # Nearly collinear windows can round differently from math.sqrt; recheck them exactly
+        borderline = decreasing & (np.abs(dist_sum - dist_first_to_last) <= 1e-9 * dist_sum)
+        for g, i in zip(*np.nonzero(borderline)):
+            critical[g, i] = is_critical_window(series[g], i, window)
+
+        game_index, start_index = np.nonzero(critical)
+        window_values = values[game_index[:, None], start_index[:, None] + np.arange(window)].tolist()
+        for g, i, points in zip(game_index.tolist(), start_index.tolist(), window_values):
+            critical_points[g].append((i, *points))
+
+    return critical_points_by_metric
+
 # Function to save results to a text file
 def save_results_to_file(critical_points, metric, output_dir):
     output_file = os.path.join(output_dir, f"{metric}_critical_points.txt")
@@ -57,78 +219,106 @@ def save_results_to_file(critical_points, metric, output_dir):
         for idx, P_i, P_i1, P_i2 in critical_points:
             f.write(f"Position {idx+1}: {P_i} -> {P_i1} -> {P_i2}\n")
     
-    print(f"Results saved to {output_file}")
+    logger.info(f"Results saved to {output_file}")
 
 # Function to generate and save a graph of the metric and its critical points
-def plot_metric_with_critical_points(metric_data, critical_points, metric, output_dir):
-    positions = list(range(1, len(metric_data) + 1))
-    
-    plt.figure(figsize=(10, 6))
-    plt.plot(positions, metric_data, marker='o', label=f'{metric} values')
-    
-    # Highlight the critical points
-    for idx, P_i, P_i1, P_i2 in critical_points:
-        plt.scatter([idx+1, idx+2, idx+3], [P_i, P_i1, P_i2], color='red', s=100, zorder=5, label='Critical Point' if idx == 0 else None)
-
-    plt.title(f'{metric} and Critical Points')
-    plt.xlabel('Position')
-    plt.ylabel(f'{metric}')
-    plt.legend()
-    plt.grid(True)
-    
-    # Save the plot
+def plot_metric_with_critical_points(metric_data, critical_points, metric, output_dir, plots=None):
+    """Saves the metric graph to output_dir, right away or through a chess_plots.PlotQueue."""
     output_file = os.path.join(output_dir, f"{metric}_graph.png")
-    plt.savefig(output_file)
-    plt.close()
-    
-    print(f"Graph saved to {output_file}")
+    job = chess_plots.metric_job(metric_data, critical_points, metric, output_file)
+    if plots is None:
+        # Rendered with a figure that is reused for every graph
+        chess_plots.render_job(job)
+        logger.info(f"Graph saved to {output_file}")
+    else:
+        plots.submit(job)
+
+# Function to find, save and plot the critical points of every metric of one game
+def analyze_game_metrics(data, output_dir=None, label="", plots=None):
+    """Runs find_critical_points on each metric of one game's rows and returns {metric: critical points}.
+
+    data is the list of row dicts returned by read_data_from_file (or built in memory),
+    or the column arrays returned by read_result_columns.
+    The text and PNG files are only written when output_dir is given; plots is an
+    optional chess_plots.PlotQueue for the PNG files.
+    """
+    if output_dir is not None and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Detect the critical points of all metrics (Variance, IQR, SD, MAD) in one pass
+    if isinstance(data, dict):
+        metric_values_by_metric = {metric: data[metric] for metric in METRICS}
+    else:
+        metric_values_by_metric = {metric: [entry[metric] for entry in data] for metric in METRICS}
+    critical_points_by_metric = {metric: points[0] for metric, points in
+                                 find_critical_points_many({metric: [values] for metric, values in metric_values_by_metric.items()}).items()}
+
+    for metric in METRICS:
+        logger.info(f"\nAnalyzing {metric} for {label}...")
+        metric_values = metric_values_by_metric[metric]
+        critical_points = critical_points_by_metric[metric]
+        logger.info(f"Found {len(critical_points)} critical points for {metric}.")
+        
+        if output_dir is not None:
+            # Save the results to a text file
+            save_results_to_file(critical_points, metric, output_dir)
+            
+            # Generate and save a plot for this metric
+            plot_metric_with_critical_points(metric_values, critical_points, metric, output_dir, plots)
+
+    return critical_points_by_metric
 
 # Main function to process a batch of files
-def analyze_metrics_from_folder(input_folder_path, output_folder_path):
+def analyze_metrics_from_folder(input_folder_path, output_folder_path, plots=None):
     # Create the output folder if it doesn't exist
     if not os.path.exists(output_folder_path):
         os.makedirs(output_folder_path)
     
-    # Get a list of TXT files in the folder
-    files = [f for f in os.listdir(input_folder_path) if f.endswith('.txt')]
+    # Get a list of TXT files and columns folders in the folder
+    files = [f for f in os.listdir(input_folder_path) if is_results_file(input_folder_path, f)]
     
-    print(f"Found {len(files)} TXT files in {input_folder_path}.")
+    logger.info(f"Found {len(files)} results files in {input_folder_path}.")
     
     for file_name in files:
         file_path = os.path.join(input_folder_path, file_name)
         
-        # Read data from the file
-        data = read_data_from_file(file_path)
+        # Read data from the file (memory-mapped for columns folders)
+        logger.info(f"Reading data from {file_path}...")
+        data = read_result_columns(file_path)
         
         # Create a subfolder to store the results for this file
         file_base_name = os.path.splitext(file_name)[0]
         output_dir = os.path.join(output_folder_path, f'analysis_results_{file_base_name}')
-        
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # Iterate over each metric (Variance, IQR, SD, MAD) and analyze them independently
-        metrics = ["Variance", "IQR", "SD", "MAD"]
-        
-        for metric in metrics:
-            print(f"\nAnalyzing {metric} for {file_name}...")
-            metric_values = [entry[metric] for entry in data]  # Extract values for the specific metric
-            
-            critical_points = find_critical_points(metric_values)
-            print(f"Found {len(critical_points)} critical points for {metric}.")
-            
-            # Save the results to a text file
-            save_results_to_file(critical_points, metric, output_dir)
-            
-            # Generate and save a plot for this metric
-            plot_metric_with_critical_points(metric_values, critical_points, metric, output_dir)
+        analyze_game_metrics(data, output_dir, file_name, plots)
     
-    print("\nBatch analysis complete.")
+    logger.info("\nBatch analysis complete.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Find critical points in the _results.txt files of a folder.")
+    # Specify the input folder containing the TXT files
+    parser.add_argument("input_folder", nargs="?", default=r'C:\Users\kakaz\Documents\chess coding\Chess Gmases output')
+    # Specify the output folder where results will be saved
+    parser.add_argument("output_folder", nargs="?", default=r'C:\Users\kakaz\Documents\chess coding\Chess Gmases output\analysis_results')
+    parser.add_argument("--convert", action="store_true",
+                        help="only convert the _results.txt files of input_folder to columns folders in output_folder")
+    parser.add_argument("--render", choices=chess_plots.RENDER_MODES, default="now",
+                        help="render graphs right away, in a process pool, or only list them in --render-manifest")
+    parser.add_argument("--render-manifest", help="JSON lines file collecting the graphs for --render later")
+    parser.add_argument("--render-pending", metavar="MANIFEST", help="only render the graphs listed in a manifest")
+    args = parser.parse_args()
+    # Show the progress messages of this module and chess_plots
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+
+    if args.render_pending:
+        chess_plots.render_manifest(args.render_pending)
+        return
+    if args.convert:
+        convert_results_folder(args.input_folder, args.output_folder)
+        return
 
-# Specify the input folder containing the TXT files
-input_folder_path = r'C:\Users\kakaz\Documents\chess coding\Chess Gmases output'
-# Specify the output folder where results will be saved
-output_folder_path = r'C:\Users\kakaz\Documents\chess coding\Chess Gmases output\analysis_results'
+    # Run the analysis on the batch of files
+    with chess_plots.PlotQueue(args.render, manifest_path=args.render_manifest) as plots:
+        analyze_metrics_from_folder(args.input_folder, args.output_folder, plots)
 
-# Run the analysis on the batch of files
-analyze_metrics_from_folder(input_folder_path, output_folder_path)
+if __name__ == "__main__":
+    main()
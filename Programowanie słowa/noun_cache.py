@@ -0,0 +1,190 @@
+import array
+import hashlib
+import json
+import os
+import shutil
+
+import nltk
+import numpy as np
+
+# Cache of the noun streams the uniqueness scripts work on. Extracting the nouns means
+# walking brown.tagged_sents() or POS tagging the whole inaugural corpus, so the result
+# is stored once per corpus and tag filter: a vocabulary file (one word per line, in
+# order of first occurrence) and an int32 array of word ids, memory-mapped when loaded,
+# plus where the nouns of each corpus file start. The cache is rebuilt when the corpus
+# fileids, the tag filter or the tagger change.
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "noun_cache")
+CACHE_FORMAT = 2
+
+# "NN": singular common nouns only (as in import nltk.py), "NN*": every noun tag (as in the inaugural script)
+TAG_FILTERS = {
+    "NN": lambda tag: tag == "NN",
+    "NN*": lambda tag: tag.startswith("NN"),
+}
+
+def tag_inaugural(fileids):
+    """
+    POS tags the inaugural corpus the way the inaugural script does (it has no tags of its own).
+    """
+    from nltk.tokenize import word_tokenize
+    for sentence in nltk.corpus.inaugural.sents(fileids):
+        yield nltk.pos_tag(word_tokenize(' '.join(sentence)))
+
+# For every corpus: its reader, the NLTK resources it needs, its tagged sentences and the
+# version of the tags (pre-tagged corpora never change, tagged ones change with the tagger)
+CORPORA = {
+    "brown": {
+        "reader": lambda: nltk.corpus.brown,
+        "resources": ["brown"],
+        "tagged_sentences": lambda fileids: nltk.corpus.brown.tagged_sents(fileids),
+        "tagger_version": lambda: "brown corpus tags",
+    },
+    "inaugural": {
+        "reader": lambda: nltk.corpus.inaugural,
+        "resources": ["inaugural", "punkt", "averaged_perceptron_tagger"],
+        "tagged_sentences": tag_inaugural,
+        "tagger_version": lambda: f"nltk {nltk.__version__} pos_tag",
+    },
+    "nps_chat": {
+        "reader": lambda: nltk.corpus.nps_chat,
+        "resources": ["nps_chat"],
+        "tagged_sentences": lambda fileids: nltk.corpus.nps_chat.tagged_posts(fileids),
+        "tagger_version": lambda: "nps_chat corpus tags",
+    },
+}
+
+class NounStream:
+    """
+    The nouns of a corpus in order, as a vocabulary and an array of word ids.
+
+    offsets[k] is the index in ids of the first noun of fileids[k] (both are None when
+    the file boundaries are not known).
+    """
+
+    def __init__(self, vocabulary, ids, fileids=None, offsets=None):
+        self.vocabulary = vocabulary
+        self.ids = ids
+        self.fileids = fileids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        vocabulary = self.vocabulary
+        for word_id in self.ids:
+            yield vocabulary[word_id]
+
+    def to_list(self):
+        """
+        Returns the nouns as a list of strings (the nouns_list of the scripts).
+        """
+        vocabulary = self.vocabulary
+        return [vocabulary[word_id] for word_id in self.ids.tolist()]
+
+def extract_nouns(tagged_sentences, tag_filter, fileids=None):
+    """
+    Returns the NounStream of the lowercased words whose tag passes tag_filter (a TAG_FILTERS key).
+
+    tagged_sentences is an iterable of tagged sentences, or, with fileids, a function
+    returning the tagged sentences of a list of fileids; the files are then read one at a
+    time to record where each one starts.
+    """
+    keep = TAG_FILTERS[tag_filter]
+    vocabulary = {}
+    ids = array.array('i')
+    offsets = None
+    if fileids is None:
+        parts = [tagged_sentences]
+    else:
+        parts = (tagged_sentences([fileid]) for fileid in fileids)
+        offsets = []
+    for part in parts:
+        if offsets is not None:
+            offsets.append(len(ids))
+        for sentence in part:
+            for word, tag in sentence:
+                if keep(tag):
+                    ids.append(vocabulary.setdefault(word.lower(), len(vocabulary)))
+    ids = np.frombuffer(ids, dtype=np.int32) if ids else np.zeros(0, dtype=np.int32)
+    return NounStream(list(vocabulary), ids, fileids, None if offsets is None else np.asarray(offsets, dtype=np.int64))
+
+def cache_key(corpus_name, fileids, tag_filter, tagger_version):
+    fileids_digest = hashlib.sha256("\n".join(fileids).encode("utf-8")).hexdigest()
+    return {"format": CACHE_FORMAT, "corpus": corpus_name, "fileids": fileids_digest, "tag_filter": tag_filter,
+            "tagger": tagger_version}
+
+def cache_path(cache_directory, corpus_name, tag_filter):
+    filter_name = tag_filter.replace("*", "_all")
+    return os.path.join(cache_directory, f"{corpus_name}_{filter_name}")
+
+def read_noun_stream(path, key):
+    """
+    Loads a cached NounStream, or returns None if there is none or it was built for another key.
+    """
+    try:
+        with open(os.path.join(path, "key.json"), "r", encoding="utf-8") as f:
+            if json.load(f) != key:
+                return None
+        with open(os.path.join(path, "vocabulary.txt"), "r", encoding="utf-8", newline="") as f:
+            vocabulary = f.read().split("\n")[:-1]
+        ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')
+        with open(os.path.join(path, "fileids.txt"), "r", encoding="utf-8", newline="") as f:
+            fileids = f.read().split("\n")[:-1]
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+    except (OSError, ValueError):
+        return None
+    return NounStream(vocabulary, ids, fileids, offsets)
+
+def write_noun_stream(path, key, stream):
+    # Write next to the target and swap it in, so a crash never leaves half a cache entry
+    temporary_path = path + ".tmp"
+    if os.path.exists(temporary_path):
+        shutil.rmtree(temporary_path)
+    os.makedirs(temporary_path)
+    with open(os.path.join(temporary_path, "vocabulary.txt"), "w", encoding="utf-8", newline="") as f:
+        f.writelines(word + "\n" for word in stream.vocabulary)
+    np.save(os.path.join(temporary_path, "ids.npy"), np.asarray(stream.ids, dtype=np.int32))
+    with open(os.path.join(temporary_path, "fileids.txt"), "w", encoding="utf-8", newline="") as f:
+        f.writelines(fileid + "\n" for fileid in stream.fileids)
+    np.save(os.path.join(temporary_path, "offsets.npy"), np.asarray(stream.offsets, dtype=np.int64))
+    # The key goes last: an entry without one is never used
+    with open(os.path.join(temporary_path, "key.json"), "w", encoding="utf-8") as f:
+        json.dump(key, f)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(temporary_path, path)
+
+def load_nouns(corpus_name, tag_filter="NN*", fileids=None, cache_directory=DEFAULT_CACHE_DIRECTORY):
+    """
+    Returns the NounStream of a corpus, extracting and caching it on the first call.
+
+    :param corpus_name: A key of CORPORA ("brown", "inaugural" or "nps_chat")
+    :param tag_filter: A key of TAG_FILTERS
+    :param fileids: The corpus files to use, all of them by default
+    :param cache_directory: Folder holding the cached streams
+    """
+    corpus = CORPORA[corpus_name]
+    if tag_filter not in TAG_FILTERS:
+        raise ValueError(f"Unknown tag filter {tag_filter!r}, expected one of {list(TAG_FILTERS)}")
+    if fileids is None:
+        try:
+            fileids = corpus["reader"]().fileids()
+        except LookupError:
+            nltk.download(corpus["resources"][0])
+            fileids = corpus["reader"]().fileids()
+    fileids = list(fileids)
+
+    key = cache_key(corpus_name, fileids, tag_filter, corpus["tagger_version"]())
+    path = cache_path(cache_directory, corpus_name, tag_filter)
+    stream = read_noun_stream(path, key)
+    if stream is not None:
+        return stream
+
+    print(f"Extracting {tag_filter} nouns from the {corpus_name} corpus (cached in {path})...")
+    for resource in corpus["resources"]:
+        nltk.download(resource, quiet=True)
+    stream = extract_nouns(corpus["tagged_sentences"], tag_filter, fileids)
+    write_noun_stream(path, key, stream)
+    return read_noun_stream(path, key)
@@ -0,0 +1,193 @@
+import itertools
+import os
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from word_uniqueness import window_hashes
+
+# Uniqueness values (as in most_unique_occurrences2) of noun streams too large to keep in
+# memory. The nouns are read from any iterable, e.g. a generator over a corpus, a block at
+# a time; a deque carries the last 2 * window_size nouns over to the next block, so every
+# noun is seen with its whole surroundings. Each (word, surroundings) pair becomes a 64-bit
+# key that goes to a buffer; a full buffer is sorted, deduplicated and written to disk as a
+# run, and the runs are merged at the end to count the distinct keys of every word. Only
+# the vocabulary, the buffer and one block of every run during the merge are in memory.
+#
+#     counts = most_unique_occurrences_streaming(without_words(nouns(), {"time"}), memory_limit=256 * 2**20)
+
+DEFAULT_MEMORY_LIMIT = 256 * 2**20  # bytes
+BLOCK_SIZE = 1 << 16  # nouns read from the stream at a time
+RECORD_BYTES = 64  # memory per buffered key, counting the copies made while sorting
+
+def without_words(nouns, words_to_remove):
+    """
+    Yields the nouns that are not in words_to_remove, the streaming counterpart of remove_word_from_nouns.
+    """
+    words_to_remove = set(words_to_remove)
+    return (noun for noun in nouns if noun not in words_to_remove)
+
+def mix64(values):
+    """
+    splitmix64 finalizer: a well-spread 64-bit hash of every value of a uint64 array.
+    """
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def stream_hash_parameters(seed=0):
+    """
+    Returns the salt of the word values and the odd base of the surroundings hashes.
+
+    Unlike hash_parameters, the value of a word id does not depend on the vocabulary
+    size, which is not known until the stream ends.
+    """
+    salt, base = mix64(np.array([2 * seed, 2 * seed + 1], dtype=np.uint64))
+    return salt, base | np.uint64(1)
+
+def pair_keys(ids, window_size, salt, base):
+    """
+    Returns the keys of the (word, surroundings) pairs of ids[window_size:-window_size], one 64-bit hash per pair.
+    """
+    values = mix64(ids.astype(np.uint64) ^ salt)
+    runs = window_hashes(values, window_size, base)
+    shift = np.uint64(pow(int(base), window_size, 2**64))
+    count = len(ids) - 2 * window_size
+    surroundings = runs[:count] * shift + runs[window_size + 1: window_size + 1 + count]
+    return mix64(surroundings ^ mix64(values[window_size: window_size + count]))
+
+class RunWriter:
+    """
+    Buffers (key, word id) records and spills them to sorted, deduplicated runs on disk.
+    """
+
+    def __init__(self, directory, capacity):
+        self.directory = directory
+        self.capacity = capacity
+        self.keys = []
+        self.words = []
+        self.size = 0
+        self.runs = []
+
+    def add(self, keys, words):
+        self.keys.append(keys)
+        self.words.append(words)
+        self.size += len(keys)
+        if self.size >= self.capacity:
+            self.spill()
+
+    def sorted_records(self):
+        keys = np.concatenate(self.keys) if self.keys else np.zeros(0, dtype=np.uint64)
+        words = np.concatenate(self.words) if self.words else np.zeros(0, dtype=np.int32)
+        self.keys, self.words, self.size = [], [], 0
+        keys, first = np.unique(keys, return_index=True)
+        return keys, words[first]
+
+    def spill(self):
+        keys, words = self.sorted_records()
+        path = os.path.join(self.directory, f"run_{len(self.runs)}")
+        np.save(path + "_keys.npy", keys)
+        np.save(path + "_words.npy", words)
+        self.runs.append(path)
+
+def merge_runs(runs, counts, block_size):
+    """
+    Adds the number of distinct keys of every word in the sorted runs to counts.
+
+    Every round reads the next block of each run and takes the records up to the smallest
+    last key among the blocks that do not finish their run, so all copies of a key are
+    counted in the same round and nothing but the current blocks is in memory.
+    """
+    keys = [np.load(path + "_keys.npy", mmap_mode='r') for path in runs]
+    words = [np.load(path + "_words.npy", mmap_mode='r') for path in runs]
+    starts = [0] * len(runs)
+    while any(start < len(run) for start, run in zip(starts, keys)):
+        ends = [min(start + block_size, len(run)) for start, run in zip(starts, keys)]
+        unfinished = [run[end - 1] for run, end in zip(keys, ends) if end < len(run)]
+        bound = min(unfinished) if unfinished else None
+        round_keys, round_words = [], []
+        for k, run in enumerate(keys):
+            block = np.asarray(run[starts[k]: ends[k]])
+            taken = len(block) if bound is None else int(np.searchsorted(block, bound, side="right"))
+            round_keys.append(block[:taken])
+            round_words.append(np.asarray(words[k][starts[k]: starts[k] + taken]))
+            starts[k] += taken
+        _, first = np.unique(np.concatenate(round_keys), return_index=True)
+        counts += np.bincount(np.concatenate(round_words)[first], minlength=len(counts))
+
+def cut_off_edge(head, tail, total, window_size):
+    """
+    Returns the set of (word id, surroundings tuple) of the words closer than window_size to either end of a stream.
+
+    Only the first and last 2 * window_size ids of the stream (head and tail) are needed;
+    the surroundings are clipped at the ends, as in cut_off_surroundings.
+    """
+    tail_start = total - len(tail)
+
+    def word_at(position):
+        return head[position] if position < len(head) else tail[position - tail_start]
+
+    edge = set()
+    for i in set(range(min(window_size, total))) | set(range(max(window_size, total - window_size), total)):
+        surroundings = tuple(word_at(j) for j in range(max(0, i - window_size), min(total, i + window_size + 1)) if j != i)
+        edge.add((word_at(i), surroundings))
+    return edge
+
+def most_unique_occurrences_streaming(nouns, window_size=10, memory_limit=DEFAULT_MEMORY_LIMIT,
+                                      temporary_directory=None, seed=0):
+    """
+    Same uniqueness values as most_unique_occurrences2 for a stream of nouns read only once.
+
+    Two different surroundings of one word could get the same 64-bit key and be counted
+    once; that is very unlikely (see most_unique_occurrences_hashed), but there is no
+    exact mode here, as the surroundings themselves are not kept.
+
+    :param nouns: Iterable of nouns in corpus order, e.g. a generator; filter stop words with without_words
+    :param window_size: Number of nouns taken on each side of a word
+    :param memory_limit: About how many bytes the buffered records and merge blocks may take
+    :param temporary_directory: Where the runs are written, the system temporary folder by default
+    :param seed: Seed of the word hashes
+    :return: List of (word, uniqueness value), most unique first, ties in order of first occurrence
+    """
+    salt, base = stream_hash_parameters(seed)
+    capacity = max(BLOCK_SIZE, memory_limit // RECORD_BYTES)
+    vocabulary = {}
+    nouns = iter(nouns)
+    head = []  # the first 2 * window_size ids, for the cut-off surroundings at the start
+    carry = deque(maxlen=2 * window_size)  # the last 2 * window_size ids read
+    total = 0
+
+    with tempfile.TemporaryDirectory(prefix="uniqueness_runs_", dir=temporary_directory) as directory:
+        writer = RunWriter(directory, capacity)
+        while True:
+            block = [vocabulary.setdefault(noun, len(vocabulary)) for noun in itertools.islice(nouns, BLOCK_SIZE)]
+            if not block:
+                break
+            if len(head) < 2 * window_size:
+                head.extend(block[:2 * window_size - len(head)])
+            total += len(block)
+            ids = np.array(list(carry) + block, dtype=np.int64)
+            carry.extend(block)
+            if len(ids) > 2 * window_size:
+                writer.add(pair_keys(ids, window_size, salt, base), ids[window_size: len(ids) - window_size].astype(np.int32))
+
+        counts = np.zeros(len(vocabulary), dtype=np.int64)
+        if writer.runs:
+            if writer.size:
+                writer.spill()
+            merge_runs(writer.runs, counts, max(1024, capacity // len(writer.runs)))
+        else:
+            _, words = writer.sorted_records()
+            counts += np.bincount(words, minlength=len(counts))
+
+    # The words closer than window_size to either end never have full surroundings in a block
+    for word, _ in cut_off_edge(head, list(carry), total, window_size):
+        counts[word] += 1
+
+    words = list(vocabulary)
+    # Word ids are given in order of first occurrence, so a stable sort keeps ties in that order
+    order = np.argsort(-counts, kind="stable").tolist()
+    values = counts.tolist()
+    return [(words[word], values[word]) for word in order]
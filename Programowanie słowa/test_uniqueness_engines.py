@@ -0,0 +1,141 @@
+import random
+import tempfile
+
+import numpy as np
+
+import streaming_uniqueness
+import word_uniqueness as wu
+from noun_cache import NounStream
+from uniqueness_index import UniquenessIndex
+
+# Randomized checks of the faster uniqueness engines against the reference functions of
+# word_uniqueness.py, on many short random noun streams (where edge cases such as streams
+# shorter than the window are common) and a longer Zipf-distributed one. Run with pytest
+# or directly:
+#
+#     python test_uniqueness_engines.py
+
+def random_streams(seed, count, max_length=60, max_vocabulary=6, max_window=6):
+    """Yields (nouns, window size) pairs of short random streams over a small vocabulary."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        vocabulary = rng.randint(1, max_vocabulary)
+        nouns = [f"w{rng.randint(0, vocabulary)}" for _ in range(rng.randint(0, max_length))]
+        yield nouns, rng.randint(1, max_window)
+
+def zipf_nouns(length, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"n{rank}" for rank in np.minimum(rng.zipf(1.2, length), 5000).tolist()]
+
+def test_hashed_matches_reference():
+    for nouns, window_size in random_streams(1, 300, max_window=12):
+        reference = wu.most_unique_occurrences2(nouns, window_size)
+        assert wu.most_unique_occurrences_hashed(nouns, window_size) == reference, (nouns, window_size)
+        assert wu.most_unique_occurrences_hashed(nouns, window_size, exact=True) == reference, (nouns, window_size)
+    nouns = zipf_nouns(50000)
+    for window_size in (1, 4, 10):
+        assert wu.most_unique_occurrences_hashed(nouns, window_size) == wu.most_unique_occurrences2(nouns, window_size)
+
+def test_hashed_exact_corrects_collisions():
+    # A hash that only sees word ids mod 3 makes different surroundings collide all the time
+    window_hashes = wu.window_hashes
+    wu.window_hashes = lambda values, window_size, base: window_hashes(values % np.uint64(3), window_size, base)
+    try:
+        for nouns, window_size in random_streams(2, 200, max_vocabulary=8, max_window=4):
+            assert wu.most_unique_occurrences_hashed(nouns, window_size, exact=True) == \
+                wu.most_unique_occurrences2(nouns, window_size), (nouns, window_size)
+    finally:
+        wu.window_hashes = window_hashes
+
+def with_sorted_neighbors(result):
+    return [(word, count, sorted(neighbors)) for word, count, neighbors in result]
+
+def test_sharded_matches_reference():
+    rng = random.Random(3)
+    for nouns, window_size in random_streams(4, 300):
+        reference = with_sorted_neighbors(wu.most_unique_occurrences(nouns, window_size))
+        shards, exact = rng.randint(1, 12), rng.random() < 0.5
+        assert with_sorted_neighbors(wu.most_unique_occurrences_sharded(nouns, window_size, shards=shards, processes=1,
+                                                                         exact=exact)) == reference, (nouns, window_size)
+        # Shards cut at file boundaries
+        ids, vocabulary = wu.encode_nouns(nouns)
+        offsets = np.array(sorted({0} | {rng.randint(0, max(len(nouns) - 1, 0)) for _ in range(4)}))
+        stream = NounStream(vocabulary, ids.astype(np.int32), None, offsets)
+        assert with_sorted_neighbors(wu.most_unique_occurrences_sharded(stream, window_size, shards=shards, processes=1,
+                                                                         exact=exact)) == reference, (nouns, window_size)
+
+def test_sharded_in_process_pool():
+    nouns = zipf_nouns(20000)
+    assert with_sorted_neighbors(wu.most_unique_occurrences_sharded(nouns, 5, shards=4, processes=2)) == \
+        with_sorted_neighbors(wu.most_unique_occurrences(nouns, 5))
+
+def test_streaming_matches_reference():
+    for nouns, window_size in random_streams(5, 300):
+        assert streaming_uniqueness.most_unique_occurrences_streaming(iter(nouns), window_size) == \
+            wu.most_unique_occurrences2(nouns, window_size), (nouns, window_size)
+
+def test_streaming_spills_and_merges_runs():
+    # Small blocks and a small memory cap make the buffer spill to dozens of runs
+    block_size = streaming_uniqueness.BLOCK_SIZE
+    streaming_uniqueness.BLOCK_SIZE = 97
+    try:
+        nouns = zipf_nouns(50000)
+        for window_size in (1, 5):
+            assert streaming_uniqueness.most_unique_occurrences_streaming(
+                (noun for noun in nouns), window_size, memory_limit=64 * 2000) == wu.most_unique_occurrences2(nouns, window_size)
+        stop_words = {"n1", "n2"}
+        without = wu.remove_word_from_nouns(wu.remove_word_from_nouns(nouns, "n1"), "n2")
+        assert streaming_uniqueness.most_unique_occurrences_streaming(
+            streaming_uniqueness.without_words(nouns, stop_words), 3, memory_limit=64 * 2000) == \
+            wu.most_unique_occurrences2(without, 3)
+    finally:
+        streaming_uniqueness.BLOCK_SIZE = block_size
+
+def assert_index_matches(index, nouns):
+    """Checks every score of an index against the sparse engine run on the whole stream."""
+    scores = wu.neighbor_uniqueness(nouns, index.window_size)
+    assert index.vocabulary == scores["vocabulary"]
+    assert np.array_equal(index.uniqueness, scores["uniqueness"])
+    assert np.allclose(index.avg_neighbor, scores["avg_neighbor"])
+    assert np.array_equal(index.max_neighbor, scores["max_neighbor"])
+    assert np.array_equal(index.max_neighbor_of_max_neighbor, scores["max_neighbor_of_max_neighbor"])
+    rows = wu.uniqueness_with_avg_neighbor_sparse(nouns, index.window_size, scores)
+    assert index.most_unique(len(rows)) == rows
+    reference = wu.most_unique_occurrences2(nouns, index.window_size)
+    for k in (1, 3, 7):
+        assert [row[:2] for row in index.most_unique(k)] == reference[:k]
+
+def test_index_matches_whole_stream():
+    rng = random.Random(6)
+    for trial in range(200):
+        window_size, vocabulary = rng.randint(1, 4), rng.randint(1, 8)
+        with tempfile.TemporaryDirectory() as directory:
+            index = UniquenessIndex.open(directory, window_size)
+            nouns = []
+            for step in range(rng.randint(1, 6)):
+                documents = [[f"w{rng.randint(0, vocabulary)}" for _ in range(rng.randint(0, 12))]
+                             for _ in range(rng.randint(0, 3))]
+                index.add_documents(documents, [f"d{step}_{k}" for k in range(len(documents))])
+                nouns += [noun for document in documents for noun in document]
+                if nouns:
+                    assert_index_matches(index, nouns)
+                if rng.random() < 0.5:
+                    index.save()
+                    index = UniquenessIndex.open(directory, window_size)
+                    assert index.total == len(nouns)
+
+def test_index_absorbs_many_documents():
+    nouns = zipf_nouns(30000)
+    cuts = [0] + sorted(random.Random(7).sample(range(1, len(nouns)), 40)) + [len(nouns)]
+    with tempfile.TemporaryDirectory() as directory:
+        index = UniquenessIndex.open(directory, 3)
+        for start, end in zip(cuts[:-1], cuts[1:]):
+            index.add_documents([nouns[start:end]])
+        index.save()
+        assert_index_matches(UniquenessIndex.open(directory, 3), nouns)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")
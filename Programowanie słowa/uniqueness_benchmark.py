@@ -0,0 +1,317 @@
+import argparse
+import cProfile
+import hashlib
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from noun_cache import NounStream
+from word_uniqueness import neighbor_matrix, row_max, uniqueness_counts_hashed
+
+# Offline benchmark of the word-uniqueness functions on synthetic noun streams, so no
+# corpus has to be downloaded. The nouns are drawn from a Zipf distribution over a fixed
+# vocabulary, the same ones for a given seed. Every function runs in a fresh process
+# for every stream size and window size, which gives its own peak RSS; the wall time,
+# the tracemalloc peak and a digest of the output are recorded as well.
+#
+#     python uniqueness_benchmark.py --save baseline.json
+#     python uniqueness_benchmark.py --baseline baseline.json --functions filter_words_sparse
+#
+# The second run fails (exit status 1) if a metric got worse than the baseline by more
+# than --tolerance, or if an engine's output differs from the output of the function it
+# replaces (taken from the same run, or from the baseline if that function did not run).
+# Other engines are added with --engine module:function=reference.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The current implementation: called with (nouns_list, window_size)
+REFERENCES = {
+    "most_unique_occurrences": "word_uniqueness:most_unique_occurrences",
+    "most_unique_occurrences2": "word_uniqueness:most_unique_occurrences2",
+    "uniqueness_with_avg_neighbor": "word_uniqueness:uniqueness_with_avg_neighbor",
+    "filter_words": "word_uniqueness:filter_words",
+}
+# Faster engines and the reference whose output they should give: called with (noun_cache.NounStream, window_size)
+ENGINES = {
+    "most_unique_occurrences_sharded": ("word_uniqueness:most_unique_occurrences_sharded", "most_unique_occurrences"),
+    "most_unique_occurrences_hashed": ("word_uniqueness:most_unique_occurrences_hashed", "most_unique_occurrences2"),
+    "most_unique_occurrences_streaming": ("streaming_uniqueness:most_unique_occurrences_streaming",
+                                          "most_unique_occurrences2"),
+    "uniqueness_with_avg_neighbor_sparse": ("word_uniqueness:uniqueness_with_avg_neighbor_sparse",
+                                            "uniqueness_with_avg_neighbor"),
+    "filter_words_sparse": ("word_uniqueness:filter_words_sparse", "filter_words"),
+}
+
+def synthetic_nouns(tokens, vocabulary_size=20000, exponent=1.1, seed=0):
+    """
+    Returns a NounStream of tokens nouns drawn from a Zipf distribution (the k-th most
+    frequent noun has probability proportional to 1 / k**exponent).
+
+    The nouns are "noun<rank>" and get their ids in order of first occurrence, like the
+    streams of noun_cache.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, vocabulary_size + 1) ** exponent
+    cumulative = np.cumsum(weights) / weights.sum()
+    ranks = np.empty(tokens, dtype=np.int32)
+    chunk = 1 << 22
+    for start in range(0, tokens, chunk):
+        end = min(tokens, start + chunk)
+        ranks[start:end] = np.minimum(np.searchsorted(cumulative, rng.random(end - start)), vocabulary_size - 1)
+    present, first, inverse = np.unique(ranks, return_index=True, return_inverse=True)
+    by_first_occurrence = np.argsort(first)
+    position = np.empty(len(present), dtype=np.int32)
+    position[by_first_occurrence] = np.arange(len(present), dtype=np.int32)
+    vocabulary = [f"noun{rank + 1}" for rank in present[by_first_occurrence].tolist()]
+    return NounStream(vocabulary, position[inverse.ravel()])
+
+def resolve(target):
+    """Returns the function named by "module:function"."""
+    module_name, function_name = target.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where the resource module is missing."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def tied_words(stream, window_size):
+    """
+    Returns the words whose max neighbor of max neighbor value depends on which of several
+    equally unique neighbors is taken as the max neighbor.
+
+    uniqueness_with_avg_neighbor takes whichever comes first in a set, so these values
+    (and whether filter_words keeps the word) are not comparable between implementations.
+    """
+    ids = np.asarray(stream.ids, dtype=np.int64)
+    uniqueness = uniqueness_counts_hashed(ids, len(stream.vocabulary), window_size)
+    neighbors = neighbor_matrix(ids, len(stream.vocabulary), window_size)
+    max_neighbor, _ = row_max(neighbors, uniqueness)
+    rows = np.repeat(np.arange(neighbors.shape[0]), np.diff(neighbors.indptr))
+    reaching = uniqueness[neighbors.indices] == max_neighbor[rows]
+    candidates = max_neighbor[neighbors.indices[reaching]]
+    lowest = np.full(neighbors.shape[0], np.iinfo(np.int64).max)
+    highest = np.full(neighbors.shape[0], np.iinfo(np.int64).min)
+    np.minimum.at(lowest, rows[reaching], candidates)
+    np.maximum.at(highest, rows[reaching], candidates)
+    return {stream.vocabulary[word] for word in np.flatnonzero(lowest < highest).tolist()}
+
+def canonical_output(reference, result, stream, window_size):
+    """
+    Returns the output of a function in a form that is equal for every correct implementation of reference.
+
+    Neighbors are compared as sorted lists, averages rounded to 9 digits, and the rows of
+    the words in tied_words without their max neighbor of max neighbor value (filter_words:
+    without those words).
+    """
+    if reference == "most_unique_occurrences":
+        return [[word, count, sorted(neighbors)] for word, count, neighbors in result]
+    if reference == "most_unique_occurrences2":
+        return [[word, count] for word, count in result]
+    tied = tied_words(stream, window_size)
+    if reference == "uniqueness_with_avg_neighbor":
+        return [[word, uniqueness, round(avg, 9), None if word in tied else max_of_max]
+                for word, uniqueness, avg, max_of_max in result]
+    return [[word, uniqueness, round(avg, 9), max_of_max] for word, uniqueness, avg, max_of_max in result
+            if word not in tied]
+
+def output_digest(output):
+    return hashlib.sha256(json.dumps(output).encode("utf-8")).hexdigest()[:16]
+
+def measure(job):
+    """
+    Runs one function on one synthetic stream and returns its metrics (called in a fresh process, see run_job).
+
+    The function runs once for the wall time and peak RSS, once more under tracemalloc
+    (unless job["allocations"] is false) and once under cProfile if job["profile"] names a file.
+    The peak RSS counts the input stream too, and not the worker processes of the sharded engine.
+    """
+    stream = synthetic_nouns(job["tokens"], job["vocabulary"], job["exponent"], job["seed"])
+    function = resolve(job["target"])
+    nouns = stream.to_list() if job["list_input"] else stream
+    window_size = job["window_size"]
+    rss_before = peak_rss_mb()
+
+    started = time.perf_counter()
+    result = function(nouns, window_size)
+    metrics = {"seconds": time.perf_counter() - started}
+    if rss_before is not None:
+        metrics["peak_rss_mb"] = peak_rss_mb()
+        metrics["rss_growth_mb"] = metrics["peak_rss_mb"] - rss_before
+    digest = output_digest(canonical_output(job["reference"], result, stream, window_size))
+    del result
+
+    if job["allocations"]:
+        tracemalloc.start()
+        function(nouns, window_size)
+        metrics["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    if job["profile"]:
+        profiler = cProfile.Profile()
+        profiler.runcall(function, nouns, window_size)
+        profiler.dump_stats(job["profile"])
+    return {"metrics": metrics, "digest": digest}
+
+def run_job(job):
+    """Runs measure(job) in a new interpreter with a fixed hash seed, so set orders are the same in every run."""
+    environment = dict(os.environ, PYTHONHASHSEED="0")
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", json.dumps(job)], cwd=HERE,
+                               env=environment, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Measuring {job['name']} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.splitlines()[-1])
+
+def benchmark_functions(args):
+    """Returns (name, target, reference, list input) of the functions selected by --functions and --engine."""
+    functions = [(name, target, name, True) for name, target in REFERENCES.items()]
+    functions += [(name, target, reference, False) for name, (target, reference) in ENGINES.items()]
+    for engine in args.engine:
+        target, reference = engine.split("=")
+        if reference not in REFERENCES:
+            raise SystemExit(f"Unknown reference {reference!r} in --engine {engine}, expected one of {list(REFERENCES)}")
+        functions.append((target.split(":")[1], target, reference, False))
+    if args.functions:
+        unknown = set(args.functions) - {name for name, _, _, _ in functions}
+        if unknown:
+            raise SystemExit(f"Unknown functions: {sorted(unknown)}")
+        functions = [function for function in functions if function[0] in args.functions]
+    return functions
+
+def run_benchmarks(args):
+    metrics = {}
+    outputs = {}
+    for tokens in args.sizes:
+        for name, target, reference, list_input in benchmark_functions(args):
+            if list_input and tokens > args.reference_limit:
+                continue
+            for window_size in args.windows:
+                key = f"{name}.n{tokens}.w{window_size}"
+                profile = os.path.join(args.profile, f"{key}.prof") if args.profile else None
+                job = {"name": name, "target": target, "reference": reference, "list_input": list_input,
+                       "tokens": tokens, "vocabulary": args.vocabulary, "exponent": args.exponent, "seed": args.seed,
+                       "window_size": window_size, "allocations": not args.no_tracemalloc, "profile": profile}
+                print(f"  {key}...", flush=True)
+                measured = run_job(job)
+                for metric, value in measured["metrics"].items():
+                    metrics[f"{key}.{metric}"] = value
+                outputs[key] = {"reference": f"{reference}.n{tokens}.w{window_size}", "digest": measured["digest"]}
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "numpy": np.__version__,
+                    "cpu_count": os.cpu_count()},
+        "settings": {"sizes": list(args.sizes), "windows": list(args.windows), "vocabulary": args.vocabulary,
+                     "exponent": args.exponent, "seed": args.seed},
+        "metrics": metrics,
+        "outputs": outputs,
+    }
+
+def compare_outputs(report, baseline=None):
+    """
+    Returns (key, reference key, matches) for every engine run whose reference output is known.
+    """
+    known = dict((baseline or {}).get("outputs", {}))
+    known.update(report["outputs"])
+    comparisons = []
+    for key, output in report["outputs"].items():
+        reference = known.get(output["reference"])
+        if output["reference"] != key and reference is not None:
+            comparisons.append((key, output["reference"], output["digest"] == reference["digest"]))
+    return comparisons
+
+# Timings shorter than this (in seconds) and memory figures smaller than this (in MB) are too noisy to flag
+NOISE_FLOOR = 0.05
+MEMORY_NOISE_FLOOR = 1.0
+
+def find_regressions(report, baseline, tolerance):
+    """Returns (metric, baseline value, new value) for the times and memory figures that grew by more than tolerance."""
+    regressions = []
+    for name, old in baseline["metrics"].items():
+        new = report["metrics"].get(name)
+        if new is None or not old:
+            continue
+        if name.endswith("_seconds") or name.endswith(".seconds"):
+            floor = NOISE_FLOOR
+        elif name.endswith("_mb"):
+            floor = MEMORY_NOISE_FLOOR
+        else:
+            continue
+        if new > old * (1 + tolerance) and max(old, new) >= floor:
+            regressions.append((name, old, new))
+    return regressions
+
+def print_report(report):
+    for name, value in report["metrics"].items():
+        print(f"  {name}: {value:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the word-uniqueness functions on synthetic Zipf noun streams.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10**4, 10**5], help="stream lengths in nouns")
+    parser.add_argument("--windows", type=int, nargs="+", default=list(range(1, 11)))
+    parser.add_argument("--vocabulary", type=int, default=20000, help="number of different nouns to draw from")
+    parser.add_argument("--exponent", type=float, default=1.1, help="exponent of the Zipf distribution")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--functions", nargs="+", help="benchmark only these functions (all by default)")
+    parser.add_argument("--engine", action="append", default=[], metavar="MODULE:FUNCTION=REFERENCE",
+                        help="also benchmark this function and compare its output with the reference one")
+    parser.add_argument("--reference-limit", type=int, default=10**5,
+                        help="run the reference functions only on streams up to this length")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--profile", help="folder for a cProfile file per function, stream size and window size")
+    parser.add_argument("--save", help="write the results to this JSON file, e.g. as a new baseline")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (0.2 = 20%%)")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(json.loads(args.measure))))
+        return
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    print("Running benchmarks:")
+    report = run_benchmarks(args)
+    print("Benchmark results:")
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.save}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline["settings"] != report["settings"]:
+            print("Warning: the baseline was run with different settings, the comparison may not be meaningful.")
+    failed = False
+    for key, reference, matches in compare_outputs(report, baseline):
+        if not matches:
+            print(f"Output of {key} differs from {reference}")
+            failed = True
+    if baseline is not None:
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print(f"Regression in {name}: {old:.3f} -> {new:.3f}")
+        failed = failed or bool(regressions)
+        if not regressions:
+            print(f"No regressions against {args.baseline}.")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import scipy.sparse
+
+from streaming_uniqueness import cut_off_edge, pair_keys, stream_hash_parameters
+from word_uniqueness import row_max
+
+# Persistent uniqueness index of a growing noun stream, one per window size. New documents
+# are appended to the end of the stream with add_documents, which indexes only the
+# surroundings and neighbor pairs they create and recomputes the scores of the words they
+# affect, instead of running most_unique_occurrences and uniqueness_with_avg_neighbor over
+# everything again. The results are those of the whole stream (documents in the order they
+# were added), surroundings crossing document boundaries included, as in nouns_list.
+#
+#     python uniqueness_index.py --corpus nps_chat --windows 1 2 3 --top 20
+#
+# adds the corpus files that are not yet indexed and prints the most unique words.
+
+DEFAULT_INDEX_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uniqueness_index")
+INDEX_FORMAT = 1
+
+def pad(values, size):
+    """
+    Returns values extended with zeros to size entries (new words start with no score).
+    """
+    return np.concatenate([values, np.zeros(size - len(values), dtype=values.dtype)])
+
+class UniquenessIndex:
+    """
+    Distinct surroundings, neighbor sets and neighbor-based scores of the words of a noun stream for one window size.
+
+    The distinct (word, surroundings) pairs are kept as a sorted array of 64-bit keys (see
+    streaming_uniqueness.pair_keys) with the number of keys per word, the neighbor relation
+    as a CSR matrix (see word_uniqueness.neighbor_matrix), and the scores per word id as in
+    word_uniqueness.neighbor_uniqueness. The first and last 2 * window_size ids give the
+    cut-off surroundings at both ends, which change whenever documents are appended.
+    """
+
+    def __init__(self, path, window_size, seed=0):
+        self.path = path
+        self.window_size = window_size
+        self.seed = seed
+        self.salt, self.base = stream_hash_parameters(seed)
+        self.vocabulary = []
+        self.word_ids = {}
+        self.documents = []
+        self.total = 0
+        self.head = np.zeros(0, dtype=np.int64)
+        self.tail = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.interior = np.zeros(0, dtype=np.int64)
+        self.neighbors = scipy.sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.uniqueness = np.zeros(0, dtype=np.int64)
+        self.avg_neighbor = np.zeros(0)
+        self.max_neighbor = np.zeros(0, dtype=np.int64)
+        self.best_neighbor = np.zeros(0, dtype=np.int64)
+        self.max_neighbor_of_max_neighbor = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def open(cls, directory, window_size, seed=0):
+        """
+        Loads the index of window_size from directory, or starts an empty one if there is none yet.
+        """
+        index = cls(os.path.join(directory, f"window_{window_size}"), window_size, seed)
+        try:
+            with open(os.path.join(index.path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except OSError:
+            return index
+        if meta != index.meta(meta["total"]):
+            raise ValueError(f"The index in {index.path} was built with other settings: {meta}")
+        with open(os.path.join(index.path, "vocabulary.txt"), "r", encoding="utf-8", newline="") as f:
+            index.vocabulary = f.read().split("\n")[:-1]
+        index.word_ids = {word: word_id for word_id, word in enumerate(index.vocabulary)}
+        with open(os.path.join(index.path, "documents.txt"), "r", encoding="utf-8", newline="") as f:
+            index.documents = f.read().split("\n")[:-1]
+        index.total = meta["total"]
+        with np.load(os.path.join(index.path, "arrays.npz")) as arrays:
+            for name in ("head", "tail", "keys", "interior", "uniqueness", "avg_neighbor", "max_neighbor", "best_neighbor",
+                         "max_neighbor_of_max_neighbor"):
+                setattr(index, name, arrays[name])
+        index.neighbors = scipy.sparse.load_npz(os.path.join(index.path, "neighbors.npz")).tocsr()
+        return index
+
+    def meta(self, total):
+        return {"format": INDEX_FORMAT, "window_size": self.window_size, "seed": self.seed, "total": total}
+
+    def save(self):
+        """
+        Writes the index to its folder, replacing the previous version only once the new one is complete.
+        """
+        temporary_path = self.path + ".tmp"
+        if os.path.exists(temporary_path):
+            shutil.rmtree(temporary_path)
+        os.makedirs(temporary_path)
+        with open(os.path.join(temporary_path, "vocabulary.txt"), "w", encoding="utf-8", newline="") as f:
+            f.writelines(word + "\n" for word in self.vocabulary)
+        with open(os.path.join(temporary_path, "documents.txt"), "w", encoding="utf-8", newline="") as f:
+            f.writelines(name + "\n" for name in self.documents)
+        np.savez(os.path.join(temporary_path, "arrays.npz"), head=self.head, tail=self.tail, keys=self.keys,
+                 interior=self.interior, uniqueness=self.uniqueness, avg_neighbor=self.avg_neighbor,
+                 max_neighbor=self.max_neighbor, best_neighbor=self.best_neighbor,
+                 max_neighbor_of_max_neighbor=self.max_neighbor_of_max_neighbor)
+        scipy.sparse.save_npz(os.path.join(temporary_path, "neighbors.npz"), self.neighbors)
+        # The metadata goes last: a folder without it is never opened
+        with open(os.path.join(temporary_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta(self.total), f)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(temporary_path, self.path)
+
+    def add_documents(self, documents, names=None):
+        """
+        Appends documents (each an iterable of nouns) to the end of the indexed stream and updates the scores.
+
+        :param documents: Iterable of documents, in corpus order
+        :param names: Names of the documents, recorded in documents (e.g. to skip them next time)
+        :return: The ids of the words whose scores were recomputed
+        """
+        word_ids = self.word_ids
+        new = []
+        for document in documents:
+            for noun in document:
+                word_id = word_ids.get(noun)
+                if word_id is None:
+                    word_id = word_ids[noun] = len(self.vocabulary)
+                    self.vocabulary.append(noun)
+                new.append(word_id)
+        self.documents.extend(names or [])
+        if not new:
+            return np.zeros(0, dtype=np.int64)
+
+        window_size = self.window_size
+        vocabulary_size = len(self.vocabulary)
+        old_total = self.total
+        # The last 2 * window_size old ids reach every word whose surroundings or neighbors gain new ids
+        ids = np.concatenate([self.tail, np.asarray(new, dtype=np.int64)])
+        ids_start = old_total - len(self.tail)
+        self.total = total = old_total + len(new)
+        if len(self.head) < 2 * window_size:
+            self.head = ids[:2 * window_size]
+        self.tail = ids[-2 * window_size:]
+
+        # Surroundings of the words that now have window_size nouns on both sides for the first time
+        self.interior = pad(self.interior, vocabulary_size)
+        start, end = max(window_size, old_total - window_size), total - window_size
+        if end > start:
+            stretch = ids[start - window_size - ids_start: end + window_size - ids_start]
+            keys, first = np.unique(pair_keys(stretch, window_size, self.salt, self.base), return_index=True)
+            words = stretch[window_size: len(stretch) - window_size][first]
+            position = np.searchsorted(self.keys, keys)
+            known = np.zeros(len(keys), dtype=bool)
+            inside = position < len(self.keys)
+            known[inside] = self.keys[position[inside]] == keys[inside]
+            self.interior += np.bincount(words[~known], minlength=vocabulary_size)
+            self.keys = np.insert(self.keys, position[~known], keys[~known])
+
+        # Neighbor pairs with at least one new noun
+        rows, columns = [], []
+        for distance in range(1, window_size + 1):
+            before = np.arange(max(0, old_total - ids_start - distance), len(ids) - distance)
+            rows.append(ids[before])
+            columns.append(ids[before + distance])
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        shape = (vocabulary_size, vocabulary_size)
+        old_neighbors = self.neighbors.copy()
+        old_neighbors.resize(shape)
+        pairs = scipy.sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=shape)
+        self.neighbors = (old_neighbors + pairs + pairs.T).tocsr()
+        self.neighbors.sum_duplicates()
+        self.neighbors.data[:] = 1
+        new_neighbors = np.flatnonzero(np.diff(self.neighbors.indptr) != np.diff(old_neighbors.indptr))
+
+        old_uniqueness = pad(self.uniqueness, vocabulary_size)
+        self.uniqueness = self.interior.copy()
+        for word, _ in cut_off_edge(self.head.tolist(), self.tail.tolist(), total, window_size):
+            self.uniqueness[word] += 1
+        changed = np.flatnonzero(self.uniqueness != old_uniqueness)
+        return self.update_scores(np.union1d(new_neighbors, self.neighbors[changed].indices))
+
+    def update_scores(self, words):
+        """
+        Recomputes the neighbor-based scores of words, and the max neighbor of max neighbor scores depending on them.
+        """
+        vocabulary_size = len(self.vocabulary)
+        self.avg_neighbor = pad(self.avg_neighbor, vocabulary_size)
+        old_max_neighbor = self.max_neighbor = pad(self.max_neighbor, vocabulary_size)
+        self.best_neighbor = pad(self.best_neighbor, vocabulary_size)
+        self.max_neighbor_of_max_neighbor = pad(self.max_neighbor_of_max_neighbor, vocabulary_size)
+
+        rows = self.neighbors[words]
+        degree = np.diff(rows.indptr)
+        neighbor_sum = rows @ self.uniqueness.astype(np.float64)
+        self.avg_neighbor[words] = np.divide(neighbor_sum, degree, out=np.zeros(len(words)), where=degree > 0)
+        maxima, best = row_max(rows, self.uniqueness)
+        max_changed = words[maxima != old_max_neighbor[words]]
+        self.max_neighbor = old_max_neighbor.copy()
+        self.max_neighbor[words] = maxima
+        self.best_neighbor[words] = best
+
+        # A word's max neighbor of max neighbor changes with its best neighbor or that neighbor's max
+        dependent = np.union1d(words, self.neighbors[max_changed].indices)
+        best = self.best_neighbor[dependent]
+        self.max_neighbor_of_max_neighbor[dependent] = np.where(best >= 0, self.max_neighbor[np.maximum(best, 0)], 0)
+        return dependent
+
+    def most_unique(self, k=10):
+        """
+        Returns the k most unique words as (word, uniqueness, average neighbor uniqueness,
+        max neighbor of max neighbor uniqueness), ties in order of first occurrence.
+
+        Only the k words are sorted; they are picked with a partition of the uniqueness values.
+        """
+        counts = self.uniqueness
+        k = min(k, len(counts))
+        if k <= 0:
+            return []
+        threshold = np.partition(counts, len(counts) - k)[len(counts) - k]
+        above = np.flatnonzero(counts > threshold)
+        tied = np.flatnonzero(counts == threshold)[:k - len(above)]
+        chosen = np.concatenate([above, tied])
+        chosen = chosen[np.lexsort((chosen, -counts[chosen]))]
+        return list(zip([self.vocabulary[word] for word in chosen.tolist()], counts[chosen].tolist(),
+                        self.avg_neighbor[chosen].tolist(), self.max_neighbor_of_max_neighbor[chosen].tolist()))
+
+    def scores(self, word):
+        """
+        Returns (uniqueness, average neighbor uniqueness, max neighbor of max neighbor uniqueness) of a word.
+        """
+        word_id = self.word_ids[word]
+        return (int(self.uniqueness[word_id]), float(self.avg_neighbor[word_id]),
+                int(self.max_neighbor_of_max_neighbor[word_id]))
+
+def add_corpus_files(directory, window_sizes, corpus_name, tag_filter="NN*"):
+    """
+    Adds the files of a corpus that are not in the indexes yet, in corpus order, and saves the indexes.
+
+    :return: Dictionary of the UniquenessIndex of every window size
+    """
+    from noun_cache import load_nouns
+    stream = load_nouns(corpus_name, tag_filter)
+    ends = np.append(stream.offsets[1:], len(stream))
+    indexes = {}
+    for window_size in window_sizes:
+        index = indexes[window_size] = UniquenessIndex.open(directory, window_size)
+        indexed = set(index.documents)
+        files = [(fileid, start, end) for fileid, start, end in zip(stream.fileids, stream.offsets.tolist(), ends.tolist())
+                 if fileid not in indexed]
+        if files:
+            print(f"Window size {window_size}: adding {len(files)} files of the {corpus_name} corpus...")
+            index.add_documents(([stream.vocabulary[word_id] for word_id in stream.ids[start:end].tolist()]
+                                 for _, start, end in files), [fileid for fileid, _, _ in files])
+            index.save()
+    return indexes
+
+def main():
+    parser = argparse.ArgumentParser(description="Add corpus files to the uniqueness indexes and list the most unique words.")
+    parser.add_argument("--corpus", default="nps_chat", help="corpus whose new files are indexed (see noun_cache.CORPORA)")
+    parser.add_argument("--tag-filter", default="NN*")
+    parser.add_argument("--windows", type=int, nargs="+", default=list(range(1, 11)))
+    parser.add_argument("--top", type=int, default=10, help="number of most unique words to print per window size")
+    parser.add_argument("--index-directory", default=DEFAULT_INDEX_DIRECTORY)
+    args = parser.parse_args()
+
+    indexes = add_corpus_files(args.index_directory, args.windows, args.corpus, args.tag_filter)
+    for window_size, index in indexes.items():
+        print(f"Window size {window_size} ({index.total} nouns, {len(index.documents)} documents):")
+        for word, uniqueness, avg_neighbor, max_of_max in index.most_unique(args.top):
+            print(f"Word: {word}, Uniqueness Value: {uniqueness}, Average Neighbor: {avg_neighbor:.2f}, "
+                  f"Max Neighbor of Max Neighbor: {max_of_max}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,596 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse
+
+# Uniqueness of nouns: the number of distinct surroundings (the window_size nouns before
+# and after) a noun occurs in. Shared by the scripts in this folder.
+
+def most_unique_occurrences(nouns_list, window_size=10):
+    """
+    Returns (word, uniqueness value, neighbors) for every noun, most unique first.
+
+    :param nouns_list: List of nouns in corpus order
+    :param window_size: Number of nouns taken on each side of a word
+    :return: List sorted by uniqueness value; ties keep the order of first occurrence
+    """
+    unique_counts = {}
+    word_neighbors = {}
+
+    for i, word in enumerate(nouns_list):
+        surroundings = tuple(nouns_list[max(0, i - window_size): i] + nouns_list[i + 1: min(len(nouns_list), i + window_size + 1)])
+        if word not in unique_counts:
+            unique_counts[word] = set()
+        unique_counts[word].add(surroundings)
+
+        if word not in word_neighbors:
+            word_neighbors[word] = set()
+
+        for j in range(-window_size, window_size + 1):
+            if i + j >= 0 and i + j < len(nouns_list) and j != 0:
+                word_neighbors[word].add(nouns_list[i + j])
+
+    words_with_unique_counts = [(word, len(unique_counts[word]), list(word_neighbors[word])) for word in unique_counts]
+    sorted_words = sorted(words_with_unique_counts, key=lambda x: x[1], reverse=True)
+    return sorted_words
+
+def remove_word_from_nouns(nouns, word_to_remove):
+    """
+    Remove all instances of a given word from the nouns list.
+
+    :param nouns: List of nouns
+    :param word_to_remove: Word to remove from the list
+    :return: Updated list of nouns
+    """
+    return [noun for noun in nouns if noun != word_to_remove]
+
+def most_unique_occurrences2(nouns_list, window_size=10, num_words=10):
+    unique_counts = {}
+
+    for i, word in enumerate(nouns_list):
+        surroundings = tuple(nouns_list[max(0, i - window_size): i] + nouns_list[i + 1: min(len(nouns_list), i + window_size + 1)])
+        if word not in unique_counts:
+            unique_counts[word] = set()
+        unique_counts[word].add(surroundings)
+
+
+    words_with_unique_counts = [(word, len(unique_counts[word])) for word in unique_counts]
+    sorted_words = sorted(words_with_unique_counts, key=lambda x: x[1], reverse=True)
+    return sorted_words
+
+def uniqueness_with_max_neighbor(nouns_list, window_size=10):
+    # Get the list of words with their uniqueness values and neighbors
+    sorted_words = most_unique_occurrences(nouns_list, window_size)
+
+    # Create a dictionary for quick lookup of uniqueness values
+    uniqueness_dict = {word: uniqueness for word, uniqueness, _ in sorted_words}
+
+    # Prepare the final list with maximum neighbor uniqueness values
+    result = []
+    for word, uniqueness, neighbors in sorted_words:
+        max_neighbor_uniqueness = max((uniqueness_dict.get(neighbor, 0) for neighbor in neighbors), default=0)
+        result.append((word, uniqueness, max_neighbor_uniqueness))
+
+    return result
+
+def generate_word_neighbors(word_list, window_size=10, existing_neighbors=None):
+    if existing_neighbors is None:
+        existing_neighbors = {}
+
+    for i, word in enumerate(word_list):
+        neighbors = existing_neighbors.get(word, set())  # Use set instead of list to avoid duplicates
+        for j in range(-window_size, window_size + 1):  # Include both ends of the window
+            if i + j >= 0 and i + j < len(word_list) and j != 0:  # Exclude the current word itself
+                neighbors.add(word_list[i + j])  # Add neighbors to the set
+        existing_neighbors[word] = neighbors
+    return existing_neighbors
+
+def create_a_list_of_values(unique_words_list, num=3):
+    values = {}
+    for word, uniqueness_value, neighbors in unique_words_list:
+        values[word] = uniqueness_value
+        max_neighbor_uniqueness = max([neighbor_uniqueness for neighbor_uniqueness in [values.get(neighbor, 0) for neighbor in neighbors]])
+        for i in range(num-1):
+            values[f"{word}_{i+1}"] = max_neighbor_uniqueness
+    return values
+
+def uniqueness_with_avg_neighbor(nouns_list, window_size=10):
+    sorted_words = most_unique_occurrences(nouns_list, window_size)
+    uniqueness_dict = {word: uniqueness for word, uniqueness, _ in sorted_words}
+    neighbor_dict = {word: neighbors for word, _, neighbors in sorted_words}
+
+    result = []
+    for word, uniqueness, neighbors in sorted_words:
+        avg_neighbor_uniqueness = sum((uniqueness_dict.get(neighbor, 0) for neighbor in neighbors)) / len(neighbors) if neighbors else 0
+        max_neighbor = max(neighbors, key=lambda neighbor: uniqueness_dict.get(neighbor, 0), default=None)
+        max_neighbor_of_max_neighbor_uniqueness = 0
+        if max_neighbor:
+            max_neighbor_neighbors = neighbor_dict.get(max_neighbor, [])
+            max_neighbor_of_max_neighbor_uniqueness = max((uniqueness_dict.get(neighbor, 0) for neighbor in max_neighbor_neighbors), default=0)
+
+        result.append((word, uniqueness, avg_neighbor_uniqueness, max_neighbor_of_max_neighbor_uniqueness))
+
+    return result
+
+def check_middle_point(values):
+    if len(values) != 3:
+        raise ValueError("The input list must contain exactly three values.")
+
+    y0, y1, y2 = values
+
+    y_line = y0 + (y2 - y0) / 2
+
+    if y1 > y_line:
+        return "above"
+    elif y1 < y_line:
+        return "below"
+    else:
+        return "on the line"
+
+def filter_words(nouns_list, window_size=10):
+    extended_uniqueness_list = uniqueness_with_avg_neighbor(nouns_list, window_size)
+    filtered_result = []
+    for word, uniqueness, avg_neighbor_uniqueness, max_neighbor_of_max_neighbor_uniqueness in extended_uniqueness_list:
+        middle_point_check = check_middle_point([uniqueness, avg_neighbor_uniqueness, max_neighbor_of_max_neighbor_uniqueness])
+        if middle_point_check == "below" and avg_neighbor_uniqueness <= uniqueness:
+            filtered_result.append((word, uniqueness, avg_neighbor_uniqueness, max_neighbor_of_max_neighbor_uniqueness))
+    # Sort the filtered result by the uniqueness value of the word
+    filtered_result_sorted = sorted(filtered_result, key=lambda x: x[1], reverse=True)
+    return filtered_result_sorted
+
+def most_unique_occurrences_many(nouns_list, window_sizes, on_window=None, neighbors=False):
+    """
+    Computes most_unique_occurrences for several window sizes in one sweep over the nouns.
+
+    The surroundings of a word for window w + 1 are its surroundings for window w plus
+    one noun on each side, so instead of building tuples of 2 * w nouns, every distinct
+    surroundings of window w gets an integer id and window w + 1 is derived from
+    (id, noun before, noun after). Only words closer than w to either end of the list,
+    whose surroundings are cut off, are compared as full tuples.
+
+    :param nouns_list: List of nouns in corpus order
+    :param window_sizes: Window sizes to compute, in any order
+    :param on_window: Called as on_window(window_size, sorted_words) as soon as a window is done
+    :param neighbors: Also return the neighbors of every word, as most_unique_occurrences does
+    :return: Dictionary of window size to the list most_unique_occurrences returns for it
+             ((word, uniqueness value) pairs unless neighbors is True)
+    """
+    window_sizes = sorted(set(window_sizes))
+    if window_sizes and window_sizes[0] < 1:
+        raise ValueError("Window sizes must be at least 1")
+
+    # Work on integer ids; words are numbered in order of first occurrence
+    vocabulary = {}
+    tokens = [vocabulary.setdefault(word, len(vocabulary)) for word in nouns_list]
+    words = list(vocabulary)
+    n = len(tokens)
+    vocabulary_size = len(words)
+
+    context_ids = [0] * n  # Id of the surroundings of each word for the current window (window 0: all empty)
+    word_neighbors = [set() for _ in words] if neighbors else None
+    results = {}
+    for window_size in range(1, window_sizes[-1] + 1 if window_sizes else 1):
+        # Words that still have window_size nouns on both sides extend their previous surroundings
+        table = {}
+        for i in range(window_size, n - window_size):
+            context_ids[i] = table.setdefault((context_ids[i], tokens[i - window_size], tokens[i + window_size]), len(table))
+
+        if word_neighbors is not None:
+            for i in range(n):
+                if i >= window_size:
+                    word_neighbors[tokens[i]].add(tokens[i - window_size])
+                if i + window_size < n:
+                    word_neighbors[tokens[i]].add(tokens[i + window_size])
+
+        if window_size not in window_sizes:
+            continue
+
+        # Distinct (word, surroundings) pairs; interior surroundings have 2 * window_size nouns,
+        # cut-off ones fewer, so the two kinds never coincide
+        pairs = {context_ids[i] * vocabulary_size + tokens[i] for i in range(window_size, n - window_size)}
+        counts = Counter(pair % vocabulary_size for pair in pairs)
+        edge = set()
+        for i in list(range(min(window_size, n))) + list(range(max(window_size, n - window_size), n)):
+            edge.add((tokens[i], tuple(tokens[max(0, i - window_size): i] + tokens[i + 1: i + window_size + 1])))
+        counts.update(token for token, _ in edge)
+
+        if word_neighbors is not None:
+            unsorted = [(word, counts[token], [words[neighbor] for neighbor in word_neighbors[token]])
+                        for token, word in enumerate(words)]
+        else:
+            unsorted = [(word, counts[token]) for token, word in enumerate(words)]
+        sorted_words = sorted(unsorted, key=lambda x: x[1], reverse=True)
+        results[window_size] = sorted_words
+        if on_window is not None:
+            on_window(window_size, sorted_words)
+    return results
+
+def encode_nouns(nouns):
+    """
+    Returns the word ids (an int64 array) and the vocabulary of a list of nouns or a noun_cache.NounStream.
+    """
+    if hasattr(nouns, "ids"):
+        return np.asarray(nouns.ids, dtype=np.int64), list(nouns.vocabulary)
+    vocabulary = {}
+    ids = np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for word in nouns), dtype=np.int64, count=len(nouns))
+    return ids, list(vocabulary)
+
+def window_hashes(values, window_size, base):
+    """
+    Polynomial hash (mod 2**64) of every run of window_size consecutive values; entry j covers values[j:j + window_size].
+    """
+    count = max(len(values) - window_size + 1, 0)
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(window_size):
+        hashes = hashes * base + values[offset: offset + count]
+    return hashes
+
+def uniqueness_order(ids, counts):
+    """
+    Returns the ids of the words that occur in ids, most unique first and ties in order of first occurrence
+    (the order of most_unique_occurrences).
+    """
+    present, first_index = np.unique(ids, return_index=True)
+    by_first_occurrence = present[np.argsort(first_index)]
+    return by_first_occurrence[np.argsort(-counts[by_first_occurrence], kind="stable")]
+
+def sort_by_uniqueness(ids, vocabulary, counts):
+    """
+    Returns (word, uniqueness value) for the words that occur in ids, ordered like most_unique_occurrences2.
+    """
+    ordered = uniqueness_order(ids, counts)
+    return [(vocabulary[word], count) for word, count in zip(ordered.tolist(), counts[ordered].tolist())]
+
+def most_unique_occurrences_hashed(nouns, window_size=10, exact=False, seed=0):
+    """
+    Same uniqueness values as most_unique_occurrences2, computed with NumPy on hashed surroundings.
+
+    Words become integer ids and the surroundings of every word a 64-bit hash of its
+    2 * window_size neighbors, built from hashes of the runs of window_size nouns in a
+    few vectorized passes. The distinct (word, hash) pairs are counted by sorting, so
+    no tuples or sets are kept. The few words closer than window_size to either end,
+    whose surroundings are cut off, are compared exactly.
+
+    Two different surroundings of one word could get the same hash and be counted once.
+    That is very unlikely; exact=True checks every group of equal hashes against the
+    actual nouns and corrects the count if it happens.
+
+    :param nouns: List of nouns in corpus order, or a noun_cache.NounStream
+    :param window_size: Number of nouns taken on each side of a word
+    :param exact: Verify that equal hashes stand for equal surroundings
+    :param seed: Seed of the random hash values of the words
+    :return: List of (word, uniqueness value), most unique first, ties in order of first occurrence
+    """
+    ids, vocabulary = encode_nouns(nouns)
+    counts = uniqueness_counts_hashed(ids, len(vocabulary), window_size, exact, seed)
+    return sort_by_uniqueness(ids, vocabulary, counts)
+
+def uniqueness_counts_hashed(ids, vocabulary_size, window_size=10, exact=False, seed=0):
+    """
+    Returns the uniqueness value of every word id (see most_unique_occurrences_hashed) as an int64 array.
+    """
+    n = len(ids)
+    counts = np.zeros(vocabulary_size, dtype=np.int64)
+    if n == 0:
+        return counts
+
+    # Words that have window_size nouns on both sides
+    interior = np.arange(window_size, n - window_size)
+    if len(interior):
+        word_values, base = hash_parameters(vocabulary_size, seed)
+        contexts = surroundings_hashes(ids, interior, window_size, word_values, base)
+
+        words = ids[interior]
+        order = np.lexsort((contexts, words))
+        sorted_words, sorted_contexts = words[order], contexts[order]
+        new_pair = np.ones(len(order), dtype=bool)
+        new_pair[1:] = (sorted_words[1:] != sorted_words[:-1]) | (sorted_contexts[1:] != sorted_contexts[:-1])
+        counts += np.bincount(sorted_words[new_pair], minlength=vocabulary_size)
+
+        if exact:
+            positions = interior[order]
+            group_start = np.maximum.accumulate(np.where(new_pair, np.arange(len(order)), 0))
+            leaders = positions[group_start]
+            collided = np.zeros(len(order), dtype=bool)
+            for offset in list(range(-window_size, 0)) + list(range(1, window_size + 1)):
+                collided |= ids[positions + offset] != ids[leaders + offset]
+            for group in np.unique(group_start[collided]).tolist():
+                members = positions[group_start == group].tolist()
+                distinct = {tuple(ids[i - window_size: i].tolist() + ids[i + 1: i + window_size + 1].tolist())
+                            for i in members}
+                counts[ids[members[0]]] += len(distinct) - 1
+
+    # Cut-off surroundings at both ends; they are shorter than 2 * window_size, so never equal to interior ones
+    edge = cut_off_surroundings(ids, list(range(min(window_size, n))) + list(range(max(window_size, n - window_size), n)),
+                                window_size)
+    for word, _ in edge:
+        counts[word] += 1
+    return counts
+
+def hash_parameters(vocabulary_size, seed=0):
+    """
+    Returns the random 64-bit value of every word id and the odd base of the surroundings hashes.
+    """
+    rng = np.random.default_rng(seed)
+    word_values = rng.integers(0, 2**64, size=vocabulary_size, dtype=np.uint64, endpoint=False)
+    base = np.uint64(rng.integers(0, 2**63, dtype=np.uint64) * 2 + 1)
+    return word_values, base
+
+def surroundings_hashes(ids, positions, window_size, word_values, base):
+    """
+    Returns the hash of the surroundings of ids[positions]; every position needs window_size ids on both sides.
+
+    The hash is the polynomial hash of the 2 * window_size surrounding word values, so the
+    same surroundings get the same hash wherever they occur in the stream.
+    """
+    runs = window_hashes(word_values[ids], window_size, base)
+    shift = np.uint64(pow(int(base), window_size, 2**64))
+    return runs[positions - window_size] * shift + runs[positions + 1]
+
+def cut_off_surroundings(ids, positions, window_size):
+    """
+    Returns the set of (word id, surroundings tuple) of ids[positions], clipping the surroundings at the ends of ids.
+    """
+    return {(int(ids[i]), tuple(ids[max(0, i - window_size): i].tolist() + ids[i + 1: i + window_size + 1].tolist()))
+            for i in positions}
+
+def neighbor_matrix(ids, vocabulary_size, window_size=10):
+    """
+    Returns the neighbor relation of most_unique_occurrences as a vocabulary x vocabulary CSR matrix.
+
+    Entry (a, b) is 1 when b occurs within window_size nouns of a (a word can be its own
+    neighbor). The matrix is symmetric, and the column indices of each row are sorted.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    shape = (vocabulary_size, vocabulary_size)
+    forward = scipy.sparse.csr_matrix(shape, dtype=np.int32)
+    # One distance at a time, so only n pairs are held besides the matrix
+    for distance in range(1, window_size + 1):
+        if distance >= len(ids):
+            break
+        pairs = scipy.sparse.csr_matrix((np.ones(len(ids) - distance, dtype=np.int32), (ids[:-distance], ids[distance:])),
+                                        shape=shape)
+        forward = forward + pairs
+    matrix = (forward + forward.T).tocsr()
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+def row_max(matrix, values):
+    """
+    For every row of a CSR matrix: the largest values[column] over its entries (0 for empty rows),
+    and the first column (smallest id) reaching it (-1 for empty rows).
+    """
+    scores = values[matrix.indices]
+    lengths = np.diff(matrix.indptr)
+    nonempty = lengths > 0
+    maxima = np.zeros(matrix.shape[0], dtype=values.dtype)
+    maxima[nonempty] = np.maximum.reduceat(scores, matrix.indptr[:-1][nonempty])
+    rows = np.repeat(np.arange(matrix.shape[0]), lengths)
+    reaching = np.flatnonzero(scores == maxima[rows])
+    argmax = np.full(matrix.shape[0], -1, dtype=np.int64)
+    # Entries are in row order, so the first entry reaching the maximum is the first one found per row
+    first_rows, first_entries = np.unique(rows[reaching], return_index=True)
+    argmax[first_rows] = matrix.indices[reaching[first_entries]]
+    return maxima, argmax
+
+def neighbor_uniqueness(nouns, window_size=10, uniqueness=None):
+    """
+    Computes the neighbor-based scores of every word with sparse matrix-vector operations.
+
+    :param nouns: List of nouns in corpus order, or a noun_cache.NounStream
+    :param window_size: Number of nouns taken on each side of a word
+    :param uniqueness: Uniqueness value per word id, computed with uniqueness_counts_hashed if not given
+    :return: Dictionary with the vocabulary, the word ids in the order of most_unique_occurrences
+             ("order") and, per word id, "uniqueness", "avg_neighbor", "max_neighbor" and
+             "max_neighbor_of_max_neighbor" arrays
+    """
+    ids, vocabulary = encode_nouns(nouns)
+    if uniqueness is None:
+        uniqueness = uniqueness_counts_hashed(ids, len(vocabulary), window_size)
+    uniqueness = np.asarray(uniqueness, dtype=np.int64)
+    neighbors = neighbor_matrix(ids, len(vocabulary), window_size)
+
+    degree = np.diff(neighbors.indptr)
+    neighbor_sum = neighbors @ uniqueness.astype(np.float64)
+    avg_neighbor = np.divide(neighbor_sum, degree, out=np.zeros(len(vocabulary)), where=degree > 0)
+    max_neighbor, best_neighbor = row_max(neighbors, uniqueness)
+    # The most unique neighbor's own most unique neighbor; ties go to the first word in the corpus
+    max_neighbor_of_max_neighbor = np.where(best_neighbor >= 0, max_neighbor[np.maximum(best_neighbor, 0)], 0)
+    return {"vocabulary": vocabulary, "order": uniqueness_order(ids, uniqueness), "uniqueness": uniqueness,
+            "avg_neighbor": avg_neighbor, "max_neighbor": max_neighbor,
+            "max_neighbor_of_max_neighbor": max_neighbor_of_max_neighbor}
+
+def uniqueness_with_max_neighbor_sparse(nouns, window_size=10, scores=None):
+    """
+    Sparse version of uniqueness_with_max_neighbor: (word, uniqueness, max neighbor uniqueness) tuples.
+    """
+    scores = scores or neighbor_uniqueness(nouns, window_size)
+    order = scores["order"]
+    return list(zip([scores["vocabulary"][word] for word in order.tolist()], scores["uniqueness"][order].tolist(),
+                    scores["max_neighbor"][order].tolist()))
+
+def uniqueness_with_avg_neighbor_sparse(nouns, window_size=10, scores=None):
+    """
+    Sparse version of uniqueness_with_avg_neighbor: (word, uniqueness, average neighbor uniqueness,
+    max neighbor of max neighbor uniqueness) tuples.
+
+    When several neighbors share the highest uniqueness, the one that occurs first in the
+    corpus is taken as the max neighbor (uniqueness_with_avg_neighbor takes whichever
+    its set happens to list first).
+    """
+    scores = scores or neighbor_uniqueness(nouns, window_size)
+    order = scores["order"]
+    return list(zip([scores["vocabulary"][word] for word in order.tolist()], scores["uniqueness"][order].tolist(),
+                    scores["avg_neighbor"][order].tolist(), scores["max_neighbor_of_max_neighbor"][order].tolist()))
+
+def filter_words_sparse(nouns, window_size=10, scores=None):
+    """
+    Same selection as filter_words, on the scores of neighbor_uniqueness.
+
+    Keeps the words whose average neighbor uniqueness lies below the line from their own
+    uniqueness to the max neighbor of max neighbor uniqueness (see check_middle_point)
+    and is at most their own uniqueness, most unique first.
+    """
+    scores = scores or neighbor_uniqueness(nouns, window_size)
+    order = scores["order"]
+    uniqueness = scores["uniqueness"][order].astype(np.float64)
+    avg_neighbor = scores["avg_neighbor"][order]
+    max_of_max = scores["max_neighbor_of_max_neighbor"][order]
+    middle = uniqueness + (max_of_max - uniqueness) / 2
+    kept = order[(avg_neighbor < middle) & (avg_neighbor <= uniqueness)]
+    # order is already sorted by uniqueness, as filter_words sorts its result
+    return list(zip([scores["vocabulary"][word] for word in kept.tolist()], scores["uniqueness"][kept].tolist(),
+                    scores["avg_neighbor"][kept].tolist(), scores["max_neighbor_of_max_neighbor"][kept].tolist()))
+
+def unique_pairs(words, contexts):
+    """
+    Returns the distinct rows of (words, contexts), sorted by word; contexts has one row of keys per word.
+    """
+    if len(words) == 0:
+        return words, contexts
+    order = np.lexsort(tuple(contexts[:, column] for column in reversed(range(contexts.shape[1]))) + (words,))
+    words, contexts = words[order], contexts[order]
+    new_pair = np.ones(len(words), dtype=bool)
+    new_pair[1:] = (words[1:] != words[:-1]) | np.any(contexts[1:] != contexts[:-1], axis=1)
+    return words[new_pair], contexts[new_pair]
+
+class ContextIndex:
+    """
+    The distinct (word, surroundings) pairs and (word, neighbor) pairs of a stretch of a noun stream.
+
+    Surroundings are kept as one 64-bit hash (see surroundings_hashes) or, when exact, as
+    the 2 * window_size surrounding word ids. Words closer than window_size to either
+    end of the whole stream have cut-off surroundings, which are kept as tuples in edge.
+    Indexes of stretches of the same stream, built with the same vocabulary and seed,
+    merge into the index of the whole stream.
+    """
+
+    def __init__(self, vocabulary_size, words, contexts, edge, neighbor_pairs):
+        self.vocabulary_size = vocabulary_size
+        self.words = words
+        self.contexts = contexts
+        self.edge = edge
+        self.neighbor_pairs = neighbor_pairs  # word id * vocabulary_size + neighbor id, distinct
+
+    @classmethod
+    def merged(cls, indexes):
+        """
+        Merges the indexes of several stretches into one.
+        """
+        indexes = list(indexes)
+        words, contexts = unique_pairs(np.concatenate([index.words for index in indexes]),
+                                       np.concatenate([index.contexts for index in indexes]))
+        edge = set().union(*(index.edge for index in indexes))
+        neighbor_pairs = np.unique(np.concatenate([index.neighbor_pairs for index in indexes]))
+        return cls(indexes[0].vocabulary_size, words, contexts, edge, neighbor_pairs)
+
+    def uniqueness(self):
+        """
+        Returns the uniqueness value of every word id as an int64 array.
+        """
+        counts = np.bincount(self.words, minlength=self.vocabulary_size).astype(np.int64)
+        for word, _ in self.edge:
+            counts[word] += 1
+        return counts
+
+    def neighbor_matrix(self):
+        """
+        Returns the neighbor relation as a CSR matrix, like neighbor_matrix.
+        """
+        rows, columns = np.divmod(self.neighbor_pairs, self.vocabulary_size)
+        shape = (self.vocabulary_size, self.vocabulary_size)
+        return scipy.sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=shape)
+
+def index_stretch(ids, offset, start, end, total, window_size, vocabulary_size, exact=False, seed=0):
+    """
+    Builds the ContextIndex of the words at positions start to end - 1 of a stream of total ids.
+
+    ids holds the stream from position offset on and must reach window_size ids past
+    both ends of the stretch (or the ends of the stream), so every word sees its full
+    surroundings and each one is counted by exactly one stretch.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    positions = np.arange(start, end)
+    interior = positions[(positions >= window_size) & (positions < total - window_size)]
+    local = interior - offset
+    if exact:
+        contexts = np.stack([ids[local + shift] for shift in list(range(-window_size, 0)) + list(range(1, window_size + 1))],
+                            axis=1) if len(local) else np.zeros((0, 2 * window_size), dtype=np.int64)
+    else:
+        word_values, base = hash_parameters(vocabulary_size, seed)
+        contexts = surroundings_hashes(ids, local, window_size, word_values, base)[:, None] if len(local) else \
+            np.zeros((0, 1), dtype=np.uint64)
+    words, contexts = unique_pairs(ids[local], contexts)
+    edge_positions = positions[(positions < window_size) | (positions >= total - window_size)] - offset
+    edge = cut_off_surroundings(ids, edge_positions.tolist(), window_size)
+
+    pairs = []
+    for distance in range(1, window_size + 1):
+        after = positions[positions + distance < total] - offset
+        before = positions[positions - distance >= 0] - offset
+        pairs.append(ids[after] * vocabulary_size + ids[after + distance])
+        pairs.append(ids[before] * vocabulary_size + ids[before - distance])
+    neighbor_pairs = np.unique(np.concatenate(pairs)) if pairs else np.zeros(0, dtype=np.int64)
+    return ContextIndex(vocabulary_size, words, contexts, edge, neighbor_pairs)
+
+def shard_ranges(total, shards, offsets=None):
+    """
+    Splits positions 0 to total - 1 into about shards stretches of similar length.
+
+    With offsets (the start of every corpus file), stretches only start at file starts.
+    """
+    targets = [round(total * k / shards) for k in range(1, shards)]
+    if offsets is not None and len(offsets):
+        starts = np.unique(np.append(np.asarray(offsets, dtype=np.int64), total))
+        targets = [int(starts[np.argmin(np.abs(starts - target))]) for target in targets]
+    boundaries = sorted(set([0, total] + targets))
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if start < end]
+
+def build_context_index(nouns, window_size=10, shards=None, processes=None, exact=False, seed=0):
+    """
+    Builds the ContextIndex of a whole noun stream in a process pool, one shard per job.
+
+    The stream is split at corpus file boundaries when nouns is a noun_cache.NounStream
+    (evenly otherwise). Every shard is sent with window_size nouns of overlap on each
+    side, so its words see their whole surroundings, but only its own words are indexed;
+    merging the shard indexes gives the same result as indexing the stream in one go.
+
+    :param nouns: List of nouns in corpus order, or a noun_cache.NounStream
+    :param shards: Number of shards, the number of processes by default
+    :param processes: Worker processes; 1 runs the shards in this process
+    :param exact: Keep the surroundings themselves instead of 64-bit hashes
+    :return: The ContextIndex, the word ids and the vocabulary
+    """
+    ids, vocabulary = encode_nouns(nouns)
+    processes = processes or os.cpu_count() or 1
+    ranges = shard_ranges(len(ids), shards or processes, getattr(nouns, "offsets", None))
+    jobs = []
+    for start, end in ranges:
+        offset = max(0, start - window_size)
+        jobs.append((ids[offset: min(len(ids), end + window_size)], offset, start, end, len(ids), window_size,
+                     len(vocabulary), exact, seed))
+    if processes == 1 or len(jobs) <= 1:
+        indexes = [index_stretch(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            indexes = list(executor.map(index_stretch, *zip(*jobs)))
+    if not indexes:
+        indexes = [index_stretch(ids, 0, 0, 0, 0, window_size, len(vocabulary), exact, seed)]
+    return ContextIndex.merged(indexes), ids, vocabulary
+
+def most_unique_occurrences_sharded(nouns, window_size=10, shards=None, processes=None, exact=False, seed=0):
+    """
+    Same result as most_unique_occurrences, computed shard by shard in a process pool (see build_context_index).
+
+    The neighbors of every word are listed in order of word id.
+    """
+    index, ids, vocabulary = build_context_index(nouns, window_size, shards, processes, exact, seed)
+    counts = index.uniqueness()
+    neighbors = index.neighbor_matrix()
+    values = counts.tolist()
+    return [(vocabulary[word], values[word],
+             [vocabulary[neighbor] for neighbor in neighbors.indices[neighbors.indptr[word]: neighbors.indptr[word + 1]].tolist()])
+            for word in uniqueness_order(ids, counts).tolist()]
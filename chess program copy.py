@@ -1,42 +1,277 @@
 import chess
 import chess.engine
-import matplotlib.pyplot as plt
+import chess.pgn
+import argparse
+import functools
+import hashlib
+import importlib.util
+import json
+import chess_plots
+import logging
 import numpy as np
 import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
-def get_moves(board, num_moves, depth, stockfish_path=r"C:\Users\kakaz\Documents\chess coding\stockfish\stockfish.exe"):
+STOCKFISH_PATH = r"C:\Users\kakaz\Documents\chess coding\stockfish\stockfish.exe"
+ENGINE_OPTIONS = {"Threads": 6, "Hash": 4096}
+MATE_SCORE = 15300
+
+# Progress goes to this logger: INFO for files and positions, DEBUG for every move
+# and score, WARNING for restarts and results files that do not match their input.
+logger = logging.getLogger("chess_program")
+
+# "two-phase": get_moves picks the candidates, evaluate_moves searches each one again.
+# "multipv": the scores come straight from the single MultiPV search (see evaluate_multipv).
+# "adaptive": like "multipv", but stops deepening once the statistics are stable (see evaluate_adaptive).
+EVALUATION_MODES = ("two-phase", "multipv", "adaptive")
+
+# Keyword arguments of analyse_position used for every position unless overridden
+DEFAULT_SEARCH = {"num_moves": 5, "depth": 20}
+
+class PooledEngine:
+    """One engine process owned by an EnginePool, restarted if it crashes mid-search."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.engine = None
+        self.restarts = 0  # over the whole life of the engine, for information only
+
+    def start(self):
+        logger.info(f"Starting engine {self.pool.stockfish_path}...")
+        # In its own process group, so a Ctrl-C in the terminal reaches only this process
+        # and the engine can finish the current search (see process_batch_of_files)
+        self.engine = chess.engine.SimpleEngine.popen_uci(self.pool.stockfish_path, setpgrp=True)
+        self.engine.configure(self.pool.options)
+
+    def quit(self):
+        if self.engine is None:
+            return
+        try:
+            self.engine.quit()
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError, TimeoutError):
+            # The process is already gone or unresponsive; make sure it does not linger
+            self.engine.close()
+        self.engine = None
+
+    def restart(self):
+        self.quit()
+        self.start()
+
+    def with_restart(self, function):
+        """Calls function(engine) on the running engine, restarting it and retrying if it died.
+
+        The engine may be restarted up to pool.max_restarts times for each call, so a few
+        crashes spread over a long batch do not abort it. Once pool.stop is set, a dead
+        engine is not restarted and the error is raised.
+        """
+        attempts = 0
+        while True:
+            if self.engine is None:
+                self.start()
+            try:
+                return function(self.engine)
+            except chess.engine.EngineTerminatedError:
+                if attempts >= self.pool.max_restarts or (self.pool.stop is not None and self.pool.stop.is_set()):
+                    raise
+                attempts += 1
+                self.restarts += 1
+                logger.warning(f"Engine terminated unexpectedly, restarting ({attempts}/{self.pool.max_restarts})...")
+                self.restart()
+
+    def analyse(self, board, limit, **kwargs):
+        """Same as SimpleEngine.analyse, but restarts the engine and retries if it died."""
+        return self.with_restart(lambda engine: engine.analyse(board, limit, **kwargs))
+
+class EnginePool:
+    """Long-lived UCI engines shared by process_fen_file and process_batch_of_files.
+
+    Engines are started on first use and configured once, so the hash table stays
+    allocated between positions. Pass the same game= key for consecutive positions
+    of one game to keep the transposition table warm (python-chess only sends
+    ucinewgame when the key changes). stop is an optional threading.Event; once it is
+    set, engines that die are no longer restarted.
+    """
+
+    def __init__(self, stockfish_path=STOCKFISH_PATH, size=1, options=None, max_restarts=3, stop=None):
+        # stockfish_path may also be a command line list, as accepted by popen_uci
+        self.stockfish_path = stockfish_path
+        self.options = dict(ENGINE_OPTIONS if options is None else options)
+        self.max_restarts = max_restarts
+        self.stop = stop
+        self.slots = [PooledEngine(self) for _ in range(size)]
+        self.idle = queue.Queue()
+        for slot in self.slots:
+            self.idle.put(slot)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def identity(self):
+        """Describes the engine binary (and the rest of its command line) and options, for keying cached evaluations."""
+        command = [self.stockfish_path] if isinstance(self.stockfish_path, str) else list(self.stockfish_path)
+        binary = []
+        for part in command:
+            try:
+                stat = os.stat(part)
+                binary.append([os.path.abspath(part), stat.st_size, int(stat.st_mtime)])
+            except OSError:
+                binary.append([part, None, None])
+        if len(binary) == 1:
+            binary = binary[0]
+        return json.dumps({"binary": binary, "options": self.options}, sort_keys=True)
+
+    def acquire(self):
+        if self.closed:
+            raise RuntimeError("Engine pool is closed")
+        return self.idle.get()
+
+    def release(self, slot):
+        self.idle.put(slot)
+
+    @contextmanager
+    def engine(self):
+        """Borrow an engine for the duration of the with block."""
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def close(self):
+        """Shut down every engine process in the pool."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        logger.info("Shutting down engine pool...")
+        for slot in self.slots:
+            slot.quit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class EvaluationCache:
+    """Persistent SQLite cache of move evaluations, checked before searching a position.
+
+    Entries are keyed by the FEN without move counters (so transpositions from
+    different games share an entry) plus the search settings and engine identity.
+    With max_entries set, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS evaluations (key TEXT PRIMARY KEY, evaluations TEXT NOT NULL, last_used REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS evaluations_last_used ON evaluations (last_used)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        self.reset_stats()
+
+    @staticmethod
+    def key(fen, engine_identity, mode, search):
+        """search holds the analyse_position keyword arguments (depth, MultiPV count, adaptive budget)."""
+        normalized_fen = chess.Board(fen).epd()
+        settings = json.dumps([normalized_fen, engine_identity, mode, search], sort_keys=True)
+        return hashlib.sha256(settings.encode()).hexdigest()
+
+    def get(self, key):
+        """Returns the cached (move, evaluation) pairs and depth searched, or None on a miss."""
+        with self.lock:
+            row = self.connection.execute("SELECT evaluations FROM evaluations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE evaluations SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        evaluations, depth = json.loads(row[0])
+        return [(chess.Move.from_uci(move), evaluation) for move, evaluation in evaluations], depth
+
+    def put(self, key, evaluations, depth):
+        stored = json.dumps([[(move.uci(), evaluation) for move, evaluation in evaluations], depth])
+        with self.lock:
+            exists = self.connection.execute("SELECT 1 FROM evaluations WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO evaluations (key, evaluations, last_used) VALUES (?, ?, ?)", (key, stored, time.time()))
+            if exists is None:
+                self.size += 1
+            if self.max_entries is not None and self.size > self.max_entries:
+                excess = self.size - self.max_entries
+                self.connection.execute(
+                    "DELETE FROM evaluations WHERE key IN (SELECT key FROM evaluations ORDER BY last_used LIMIT ?)", (excess,))
+                self.evictions += excess
+                self.size -= excess
+            self.connection.commit()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def report(self):
+        """Logs the hits and misses since the last reset_stats."""
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0
+        logger.info(f"Evaluation cache {self.path}: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+              f"{self.evictions} evicted, {self.size} entries")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def get_moves(board, num_moves, depth, stockfish_path=STOCKFISH_PATH, engine=None, game=None, infos=None):
     moves = []
-    engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
-    engine.configure({"Threads": 6, "Hash": 4096})
+    own_engine = engine is None
+    if own_engine:
+        engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
+        engine.configure(ENGINE_OPTIONS)
 
-    print(f"Analyzing board with depth {depth} for {num_moves} best moves...")
+    logger.debug(f"Analyzing board with depth {depth} for {num_moves} best moves...")
     
     # Analyse the board position
-    info_list = engine.analyse(board, chess.engine.Limit(depth=depth), multipv=num_moves)
+    info_list = engine.analyse(board, chess.engine.Limit(depth=depth), multipv=num_moves, game=game)
+    if infos is not None and info_list:
+        infos.append(info_list[0])
 
     # Retrieve moves without evaluations
     for i, info in enumerate(info_list):
         if "pv" in info and info["pv"]:
             move = info["pv"][0]
             moves.append(move)  # Get the top move in the principal variation
-            print(f"Move {i + 1}: {move}")
+            logger.debug(f"Move {i + 1}: {move}")
 
-    engine.quit()
+    if own_engine:
+        engine.quit()
 
     return moves
 
-def evaluate_moves(position, moves, depth):
+def evaluate_moves(position, moves, depth, engine=None, game=None, infos=None):
     evaluations = []
-    stockfish_path = r"C:\Users\kakaz\Documents\chess coding\stockfish\stockfish.exe"
-    engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
-    engine.configure({"Threads": 6, "Hash": 4096})
+    own_engine = engine is None
+    if own_engine:
+        engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
+        engine.configure(ENGINE_OPTIONS)
 
-    print(f"Evaluating {len(moves)} moves at depth {depth}...")
+    logger.debug(f"Evaluating {len(moves)} moves at depth {depth}...")
 
     for i, move in enumerate(moves):
         board = position.copy()
         board.push(move)
-        result = engine.analyse(board, chess.engine.Limit(depth=depth))
+        result = engine.analyse(board, chess.engine.Limit(depth=depth), game=game)
+        if infos is not None:
+            infos.append(result)
 
         evaluation = None
 
@@ -45,137 +280,846 @@ def evaluate_moves(position, moves, depth):
             score = result["score"]
             
             if isinstance(score, chess.engine.PovScore):
-                if score.is_mate():
-                    mate_value = score.relative.moves
-                    if mate_value is not None:
-                        if mate_value > 0:
-                            evaluation = 15300  # Mate for White
-                        elif mate_value < 0:
-                            evaluation = -15300  # Mate for Black
-                else:
-                    evaluation = score.relative.cp
+                evaluation = score_to_evaluation(score.relative)
         
-        print(f"Move {i + 1}: {move}, Evaluation: {evaluation}")
+        logger.debug(f"Move {i + 1}: {move}, Evaluation: {evaluation}")
         evaluations.append((move, evaluation))
     
-    engine.quit()
+    if own_engine:
+        engine.quit()
     return evaluations
 
+def score_to_evaluation(score):
+    """Converts a relative Score to centipawns, mapping mates to +/-MATE_SCORE (None for mate 0)."""
+    if score.is_mate():
+        mate_value = score.moves
+        if mate_value is not None:
+            if mate_value > 0:
+                return MATE_SCORE  # Side to move mates
+            elif mate_value < 0:
+                return -MATE_SCORE  # Side to move gets mated
+        return None
+    return score.cp
+
+def evaluate_multipv(position, num_moves, depth, engine=None, game=None, infos=None):
+    """Evaluates the best moves using the scores of a single MultiPV search.
+
+    Replaces the get_moves + evaluate_moves pair (one candidate search followed by
+    one search per candidate) with one search, so a position costs one deep search
+    instead of six. Each score is negated so it has the same orientation as in
+    evaluate_moves, i.e. from the point of view of the side to move after the
+    candidate, and mates map to +/-MATE_SCORE the same way.
+
+    The statistics are not identical to the two-phase mode:
+    - evaluate_moves searches depth plies after the candidate, one ply deeper than
+      the MultiPV line, and starts each search with the hash of the previous ones;
+    - a candidate that mates immediately gets -MATE_SCORE here, while evaluate_moves
+      sees "mate 0" for it and drops it from the scores;
+    - lower MultiPV lines are only searched until they are proven worse than the
+      better ones, so their scores can be bounds rather than exact values.
+    compare_evaluation_modes measures the difference on existing results files.
+    """
+    evaluations = []
+    own_engine = engine is None
+    if own_engine:
+        engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
+        engine.configure(ENGINE_OPTIONS)
+
+    logger.debug(f"Analyzing board with depth {depth} for {num_moves} best moves (MultiPV scores)...")
+
+    info_list = engine.analyse(position, chess.engine.Limit(depth=depth), multipv=num_moves, game=game)
+    if infos is not None and info_list:
+        infos.append(info_list[0])
+
+    for i, info in enumerate(info_list):
+        if "pv" in info and info["pv"]:
+            move = info["pv"][0]
+            evaluation = None
+            if "score" in info:
+                evaluation = score_to_evaluation(-info["score"].relative)
+            logger.debug(f"Move {i + 1}: {move}, Evaluation: {evaluation}")
+            evaluations.append((move, evaluation))
+
+    if own_engine:
+        engine.quit()
+
+    return evaluations
+
+def evaluate_adaptive(position, num_moves, depth, engine, game=None, stable_iterations=3, tolerance=5,
+                      min_depth=10, nodes=None, time_limit=None, infos=None):
+    """Evaluates the best moves with a MultiPV search that stops early once the statistics settle.
+
+    Watches the MultiPV lines as the engine deepens and computes the spread, SD, MAD
+    and IQR after every completed depth. The search is stopped when none of the SD, MAD
+    and IQR has moved by more than tolerance centipawns (the variance, in centipawns
+    squared, follows the SD) for stable_iterations consecutive depths (counting only
+    from min_depth on), or when depth, nodes or time_limit (seconds) runs out.
+    Scores are oriented and mate-mapped as in evaluate_multipv.
+    Returns the (move, evaluation) pairs of the last completed depth and that depth.
+    """
+    logger.debug(f"Analyzing board up to depth {depth} for {num_moves} best moves (adaptive)...")
+    expected_lines = min(num_moves, position.legal_moves.count())
+    limit = chess.engine.Limit(depth=depth, nodes=nodes, time=time_limit)
+
+    def line_evaluations(lines):
+        return [(info["pv"][0], score_to_evaluation(-info["score"].relative)) for _, info in sorted(lines.items())]
+
+    completed = None  # (depth, evaluations) of the last depth with all lines
+    lines = {}
+    lines_depth = None
+    previous_statistics = None
+    stable = 0
+    last_info = None  # Latest info with the search counters (nodes, hashfull, ...)
+    with engine.analysis(position, limit, multipv=num_moves, game=game) as analysis:
+        for info in analysis:
+            if "nodes" in info:
+                last_info = info
+            if "pv" not in info or not info["pv"] or "score" not in info or "depth" not in info:
+                continue
+            if info.get("lowerbound") or info.get("upperbound"):
+                continue
+            if info["depth"] != lines_depth:
+                lines, lines_depth = {}, info["depth"]
+            lines[info.get("multipv", 1)] = info
+            if len(lines) < expected_lines:
+                continue
+
+            # All lines of this depth are in
+            completed = (lines_depth, line_evaluations(lines))
+            scores = [evaluation for _, evaluation in completed[1] if evaluation is not None]
+            statistics = compute_statistics(scores) if scores else None
+            if previous_statistics is not None and statistics is not None and lines_depth >= min_depth and \
+                    max(abs(a - b) for a, b in zip(statistics[1:], previous_statistics[1:])) <= tolerance:
+                stable += 1
+            else:
+                stable = 0
+            previous_statistics = statistics
+            if stable >= stable_iterations:
+                logger.debug(f"Statistics stable for {stable} iterations, stopping at depth {lines_depth}.")
+                analysis.stop()
+                break
+
+    if completed is None:
+        # The budget ran out before one depth was complete; use whatever lines there are
+        completed = (lines_depth or 0, line_evaluations(lines))
+    if infos is not None and last_info is not None:
+        infos.append(last_info)
+    reached_depth, evaluations = completed
+    for i, (move, evaluation) in enumerate(evaluations):
+        logger.debug(f"Move {i + 1}: {move}, Evaluation: {evaluation}")
+    return evaluations, reached_depth
+
+def analyse_position(position, engine, mode="two-phase", num_moves=5, depth=20, game=None, metrics=None, **adaptive):
+    """Returns the (move, evaluation) pairs of the best moves using the given evaluation mode, and the depth searched.
+
+    adaptive holds the extra keyword arguments of evaluate_adaptive for mode="adaptive".
+    If metrics (a dict) is given, it is filled with the wall time of the search phases and
+    the engine counters (see engine_metrics). search_seconds is the candidate search of
+    get_moves or the single MultiPV search, evaluation_seconds is evaluate_moves (0 in the
+    MultiPV modes, where the candidates are scored by the same search).
+    """
+    infos = [] if metrics is not None else None
+    started = time.perf_counter()
+    searched = None
+    if mode == "two-phase":
+        best_moves = get_moves(position, num_moves=num_moves, depth=depth, engine=engine, game=game, infos=infos)
+        searched = time.perf_counter()
+        result = evaluate_moves(position, best_moves, depth=depth, engine=engine, game=game, infos=infos), depth
+    elif mode == "multipv":
+        result = evaluate_multipv(position, num_moves=num_moves, depth=depth, engine=engine, game=game, infos=infos), depth
+    elif mode == "adaptive":
+        def search(engine):
+            if infos is not None:
+                del infos[:]  # Drop what a crashed attempt reported
+            return evaluate_adaptive(position, num_moves, depth, engine, game=game, infos=infos, **adaptive)
+        if isinstance(engine, PooledEngine):
+            result = engine.with_restart(search)
+        else:
+            result = search(engine)
+    else:
+        raise ValueError(f"Unknown evaluation mode {mode!r}, expected one of {EVALUATION_MODES}")
+    finished = time.perf_counter()
+
+    if metrics is not None:
+        if searched is None:
+            searched = finished
+        metrics["search_seconds"] = searched - started
+        metrics["evaluation_seconds"] = finished - searched
+        metrics.update(engine_metrics(infos))
+    return result
+
+def engine_metrics(infos):
+    """Combines the engine info of the searches of one position.
+
+    Returns the total nodes, the nodes per second over the engine's own search time, the
+    hashfull (permille) after the last search and the deepest seldepth. Counters the
+    engine did not report are None.
+    """
+    nodes = [info["nodes"] for info in infos if "nodes" in info]
+    engine_time = sum(info.get("time", 0) for info in infos)
+    nps = None
+    if nodes and engine_time:
+        nps = round(sum(nodes) / engine_time)
+    elif any("nps" in info for info in infos):
+        nps = [info["nps"] for info in infos if "nps" in info][-1]
+    hashfull = [info["hashfull"] for info in infos if "hashfull" in info]
+    seldepth = [info["seldepth"] for info in infos if "seldepth" in info]
+    return {"nodes": sum(nodes) if nodes else None, "nps": nps, "hashfull": hashfull[-1] if hashfull else None,
+            "seldepth": max(seldepth) if seldepth else None}
+
+def compute_statistics(scores):
+    """Returns the spread, standard deviation, MAD and IQR of a list of evaluations."""
+    spread = max(scores) - min(scores)
+    std = np.std(scores)
+    median = np.median(scores)
+    deviations = np.abs(scores - median)
+    MAD = np.median(deviations)
+    q3 = np.percentile(scores, 75)
+    q1 = np.percentile(scores, 25)
+    iqr = q3 - q1
+    return spread, std, MAD, iqr
+
 def format_fens(file_path):
     """Reads FENs from a text file and returns them as a list."""
     with open(file_path, 'r') as f:
         return f.read().strip().split('\n')
 
-def save_results(file_path, results):
-    """Saves the calculated results to a text file."""
-    print(f"Saving results to {file_path}...")
+def read_fens_from_results(file_path):
+    """Reads the FEN column of a _results.txt file, in position order."""
+    with open(file_path, 'r') as f:
+        next(f)  # Skip the header
+        return [line.split(", ")[1] for line in f if line.strip()]
+
+RESULTS_HEADER = "Position Number, FEN, Variance, Standard Deviation, MAD, IQR, Depth\n"
+
+def format_result_row(result):
+    pos_num, fen, variance, std_dev, mad, iqr, depth = result
+    return f"{pos_num}, {fen}, {variance}, {std_dev}, {mad}, {iqr}, {depth}\n"
+
+def parse_result_row(line):
+    """Parses one line of a _results.txt file back into a result tuple."""
+    pos_num, fen, variance, std_dev, mad, iqr, depth = line.rstrip("\n").split(", ")
+    return (int(pos_num), fen, float(variance), float(std_dev), float(mad), float(iqr), int(depth))
+
+def results_file_path(file_path, output_folder):
+    """Returns the _results.txt path for an input file."""
+    base_name = os.path.basename(file_path)
+    return os.path.join(output_folder, f"{os.path.splitext(base_name)[0]}_results.txt")
+
+# "text": the _results.txt file. "columns": a _results.columns folder of typed .npy
+# columns (see write_result_columns in Chess data analysis.py).
+RESULTS_FORMATS = ("text", "columns")
+
+def columns_path(file_path):
+    """Returns the columns folder that replaces a _results.txt file."""
+    return os.path.splitext(file_path)[0] + ".columns"
+
+def save_results(file_path, results, results_format="text"):
+    """Saves the calculated results to a text file, or to a columns folder next to it."""
+    if results_format == "columns":
+        file_path = columns_path(file_path)
+        logger.info(f"Saving results to {file_path}...")
+        load_analysis_module().write_result_columns(file_path, results)
+        logger.info("Results saved.")
+        return
+    logger.info(f"Saving results to {file_path}...")
     with open(file_path, 'w') as f:
-        f.write("Position Number, FEN, Variance, Standard Deviation, MAD, IQR\n")
+        f.write(RESULTS_HEADER)
         for result in results:
-            pos_num, fen, variance, std_dev, mad, iqr = result
-            f.write(f"{pos_num}, {fen}, {variance}, {std_dev}, {mad}, {iqr}\n")
-    print("Results saved.")
+            f.write(format_result_row(result))
+    logger.info("Results saved.")
+
+def read_partial_results(file_path, fens):
+    """Reads the rows of an interrupted _results.txt file for resuming.
+
+    Returns (rows, their lines, number of positions done), or None if the file does not belong to
+    these FENs, i.e. the input file changed since the partial results were written.
+    A last line cut off in the middle of writing is ignored.
+    """
+    with open(file_path, 'r') as f:
+        lines = f.readlines()
+    if not lines or lines[0] != RESULTS_HEADER:
+        return None
+    rows = []
+    kept_lines = []
+    for line in lines[1:]:
+        if not line.endswith("\n"):
+            break
+        try:
+            row = parse_result_row(line)
+        except ValueError:
+            return None
+        pos_num, fen = row[0], row[1]
+        if not 1 <= pos_num <= len(fens) or fens[pos_num - 1] != fen or (rows and pos_num <= rows[-1][0]):
+            return None
+        rows.append(row)
+        kept_lines.append(line)
+    # Rows are written in position order, so everything up to the last row is done
+    # (positions in between had no scores)
+    return rows, kept_lines, rows[-1][0] if rows else 0
+
+def read_finished_columns(file_path, fens):
+    """Returns the rows of the finished columns folder for a _results.txt path, if it matches fens."""
+    folder = columns_path(file_path)
+    if not os.path.isdir(folder):
+        return None
+    columns = load_analysis_module().read_result_columns(folder)
+    rows = list(zip(columns["Position"].tolist(), [fen.decode() for fen in columns["FEN"]],
+                    *(columns[name].tolist() for name in ["Variance", "SD", "MAD", "IQR", "Depth"])))
+    if any(not 1 <= pos_num <= len(fens) or fens[pos_num - 1] != fen for pos_num, fen, *_ in rows):
+        logger.warning(f"{folder} does not match its input file any more, starting it again.")
+        return None
+    return rows
+
+def complete_results(writer, results_format):
+    """Converts a finished streamed _results.txt to the requested format."""
+    if results_format == "columns":
+        save_results(writer.output_file, writer.results, results_format)
+        os.remove(writer.output_file)
+
+class ResultsWriter:
+    """Writes the rows of one _results.txt file as soon as the positions finish.
+
+    Positions may finish out of order (see process_batch_of_files); rows are held back
+    until all earlier positions are done, so the file is always in position order and
+    every line in it is final. With resume=True an existing partial file is continued
+    (see read_partial_results) instead of overwritten.
+    """
+
+    def __init__(self, output_file, fens, resume=False):
+        self.output_file = output_file
+        self.results = []
+        self.next_index = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        partial = None
+        if resume and os.path.exists(output_file):
+            partial = read_partial_results(output_file, fens)
+            if partial is None:
+                logger.warning(f"{output_file} does not match its input file any more, starting it again.")
+        if partial is not None:
+            self.results, kept_lines, self.next_index = partial
+            logger.info(f"Resuming {output_file} after position {self.next_index}.")
+            self.file = open(output_file, 'w')
+            self.file.write(RESULTS_HEADER)
+            self.file.writelines(kept_lines)
+        else:
+            self.file = open(output_file, 'w')
+            self.file.write(RESULTS_HEADER)
+        self.file.flush()
+
+    def add(self, index, result):
+        """Records the result row (or None if there were no scores) of position index."""
+        with self.lock:
+            self.pending[index] = result
+            while self.next_index in self.pending:
+                result = self.pending.pop(self.next_index)
+                if result is not None:
+                    self.file.write(format_result_row(result))
+                    self.results.append(result)
+                self.next_index += 1
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class MetricsLog:
+    """JSON lines file with one record per analysed position and a summary record per game.
+
+    Position records (type "position") hold the game key, position number, FEN, mode,
+    depth reached, the wall time of the search, evaluation and statistics phases and in
+    total, the engine counters of engine_metrics and the cache outcome ("hit", "miss",
+    or None without a cache). Engine counters and phase times are None for cache hits.
+    summarize(game) writes the totals of a game (type "summary") once it is complete.
+    Safe to share between the worker threads of process_batch_of_files.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a' if append else 'w')
+        self.games = {}
+
+    def add(self, record):
+        with self.lock:
+            self.file.write(json.dumps(dict(record, type="position")) + "\n")
+            self.file.flush()
+            self.games.setdefault(record["game"], []).append(record)
+
+    def summarize(self, game):
+        """Writes and returns the summary of game, or None if none of its positions were analysed in this run."""
+        with self.lock:
+            records = self.games.pop(game, None)
+        if not records:
+            return None
+
+        def total(name):
+            return sum(record[name] or 0 for record in records)
 
-def plot_statistics(position_variance, position_sd, position_MAD, position_iqr):
-    """Plot the Variance, Standard Deviation, MAD, and IQR of the FEN positions."""
-    fens, variances = zip(*position_variance)
+        engine_seconds = total("search_seconds") + total("evaluation_seconds")
+        slowest = max(records, key=lambda record: record["seconds"])
+        hashfull = [record["hashfull"] for record in records if record["hashfull"] is not None]
+        summary = {
+            "type": "summary", "game": game, "positions": len(records),
+            "cache_hits": sum(record["cache"] == "hit" for record in records),
+            "seconds": total("seconds"), "search_seconds": total("search_seconds"),
+            "evaluation_seconds": total("evaluation_seconds"), "statistics_seconds": total("statistics_seconds"),
+            "nodes": total("nodes"), "nps": round(total("nodes") / engine_seconds) if engine_seconds else None,
+            "max_hashfull": max(hashfull) if hashfull else None,
+            "mean_depth": sum(record["depth"] for record in records) / len(records),
+            "slowest_position": slowest["position"], "slowest_seconds": slowest["seconds"],
+        }
+        with self.lock:
+            self.file.write(json.dumps(summary) + "\n")
+            self.file.flush()
+        logger.info(f"{os.path.basename(game)}: {summary['positions']} positions in {summary['seconds']:.1f}s, "
+                    f"{summary['nodes']} nodes ({summary['nps']} nps), {summary['cache_hits']} cache hits, "
+                    f"slowest position {summary['slowest_position']} ({summary['slowest_seconds']:.1f}s)")
+        return summary
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def plot_statistics(position_variance, position_sd, position_MAD, position_iqr, output_file, plots=None, positions=None):
+    """Plot the Variance, Standard Deviation, MAD, and IQR of the FEN positions and save it to output_file.
+
+    The bars are labelled with the position numbers (1, 2, ... unless positions is
+    given) rather than one FEN per bar. plots is an optional chess_plots.PlotQueue;
+    without it the plot is rendered right away with a reused figure.
+    """
+    _, variances = zip(*position_variance)
     _, std_devs = zip(*position_sd)
     _, mads = zip(*position_MAD)
     _, iqrs = zip(*position_iqr)
-    
-    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
-    
-    # Plot Variance
-    axes[0, 0].bar(fens, variances)
-    axes[0, 0].set_title('Variance')
-    axes[0, 0].set_xticklabels(fens, rotation=45)
-    
-    # Plot Standard Deviation
-    axes[0, 1].bar(fens, std_devs)
-    axes[0, 1].set_title('Standard Deviation')
-    axes[0, 1].set_xticklabels(fens, rotation=45)
-    
-    # Plot Mean Absolute Deviation
-    axes[1, 0].bar(fens, mads)
-    axes[1, 0].set_title('Mean Absolute Deviation')
-    axes[1, 0].set_xticklabels(fens, rotation=45)
-    
-    # Plot Interquartile Range
-    axes[1, 1].bar(fens, iqrs)
-    axes[1, 1].set_title('Interquartile Range')
-    axes[1, 1].set_xticklabels(fens, rotation=45)
-    
-    
+    if positions is None:
+        positions = range(1, len(variances) + 1)
 
-def process_fen_file(file_path, output_folder):
-    """Processes a single FEN file and saves the results, with position number included."""
-    print(f"Processing FEN file: {file_path}")
-    fens = format_fens(file_path)
-    
+    job = chess_plots.statistics_job(positions, [variances, std_devs, mads, iqrs], output_file)
+    if plots is None:
+        chess_plots.render_job(job)
+        logger.info(f"Statistics plot saved to {output_file}")
+    else:
+        plots.submit(job)
+
+def analyse_chunk(pool, file_path, start, fens, mode="two-phase", cache=None, on_result=None, search=None,
+                  metrics_log=None, stop=None):
+    """Analyses consecutive positions of one game on a single borrowed engine.
+
+    fens are FEN strings or chess.Board objects; a board's move stack is sent to the
+    engine too, so it knows the game history. file_path is the game key passed as game=.
+    Returns (position number, FEN, variance, standard deviation, MAD, IQR, depth) rows for
+    the positions that produced scores; start is the index of fens[0] in the game.
+    search overrides DEFAULT_SEARCH (see analyse_position for the keys).
+    Positions found in cache (an EvaluationCache) are not searched again.
+    on_result(index, row) is called as each position finishes, with None as the row
+    when the position produced no scores.
+    With a MetricsLog, a record of the timings and engine counters of every position is added to it.
+    Once stop (a threading.Event) is set, the chunk ends after the current position.
+    """
+    search = dict(DEFAULT_SEARCH, **(search or {}))
     results = []
-    position_variance = []
-    position_sd = []
-    position_MAD = []
-    position_iqr = []
-
-    for i, fen in enumerate(fens):
-        print(f"Processing position {i + 1}...")
-        position = chess.Board(fen)
-        best_moves = get_moves(position, num_moves=5, depth=20)
-        evaluations = evaluate_moves(position, best_moves, depth=20)
-
-        # Extract evaluation scores for variance calculation
-        scores = [evaluation for _, evaluation in evaluations if evaluation is not None]
-        if scores:
-            spread = max(scores) - min(scores)
-            std = np.std(scores)
-            median = np.median(scores)
-            deviations = np.abs(scores - median)
-            MAD = np.median(deviations)
-            q3 = np.percentile(scores, 75)
-            q1 = np.percentile(scores, 25)
-            iqr = q3 - q1
-            
-            # Store results with position number
-            results.append((i + 1, fen, spread, std, MAD, iqr))
-            position_variance.append((fen, spread))
-            position_sd.append((fen, std))
-            position_MAD.append((fen, MAD))
-            position_iqr.append((fen, iqr))
-    
-    # Generate the output file name based on the input file name
-    base_name = os.path.basename(file_path)
-    output_file = os.path.join(output_folder, f"{os.path.splitext(base_name)[0]}_results.txt")
-    
-    # Save results to the output file
-    save_results(output_file, results)
+    with pool.engine() as engine:
+        for i, fen in enumerate(fens, start):
+            if stop is not None and stop.is_set():
+                break
+            logger.info(f"Processing position {i + 1} of {os.path.basename(file_path)}...")
+            started = time.perf_counter()
+            if isinstance(fen, chess.Board):
+                position, fen = fen, fen.fen()
+            else:
+                position = chess.Board(fen)
+            cached = None
+            if cache is not None:
+                key = cache.key(fen, pool.identity(), mode, search)
+                cached = cache.get(key)
+            metrics = {"search_seconds": None, "evaluation_seconds": None, **engine_metrics([])}
+            if cached is not None:
+                evaluations, depth = cached
+            else:
+                evaluations, depth = analyse_position(position, engine, mode=mode, game=file_path, metrics=metrics, **search)
+                if cache is not None:
+                    cache.put(key, evaluations, depth)
+
+            # Extract evaluation scores for variance calculation
+            scores = [evaluation for _, evaluation in evaluations if evaluation is not None]
+            computing = time.perf_counter()
+            result = None
+            if scores:
+                spread, std, MAD, iqr = compute_statistics(scores)
+                # Store results with position number
+                result = (i + 1, fen, spread, std, MAD, iqr, depth)
+                results.append(result)
+            finished = time.perf_counter()
+            if on_result is not None:
+                on_result(i, result)
+            if metrics_log is not None:
+                metrics_log.add({"game": file_path, "position": i + 1, "fen": fen, "mode": mode, "depth": depth,
+                                 **metrics, "statistics_seconds": finished - computing, "seconds": finished - started,
+                                 "cache": None if cache is None else "miss" if cached is None else "hit"})
+    return results
+
+def finish_fen_file(results, output_file, plots=None):
+    """Plots the results of one FEN file once all of its positions are done, next to its output_file."""
+    if results:
+        position_variance = [(fen, spread) for _, fen, spread, _, _, _, _ in results]
+        position_sd = [(fen, std) for _, fen, _, std, _, _, _ in results]
+        position_MAD = [(fen, MAD) for _, fen, _, _, MAD, _, _ in results]
+        position_iqr = [(fen, iqr) for _, fen, _, _, _, iqr, _ in results]
+        positions = [pos_num for pos_num, *_ in results]
+        plot_file = f"{os.path.splitext(output_file)[0]}_statistics.png"
+        plot_statistics(position_variance, position_sd, position_MAD, position_iqr, plot_file, plots, positions)
+
+def process_fen_file(file_path, output_folder, pool=None, mode="two-phase", cache=None, resume=False, search=None,
+                     results_format="text", metrics_log=None):
+    """Processes a single FEN file and saves the results, with position number included.
+
+    Engines are borrowed from pool; a private single-engine pool is used if none is given.
+    mode is one of EVALUATION_MODES and search overrides DEFAULT_SEARCH, e.g.
+    {"stable_iterations": 4, "nodes": 50_000_000} for mode="adaptive".
+    cache is an optional EvaluationCache. Rows are written as the positions finish; with resume=True the positions already
+    in an interrupted _results.txt are skipped. With results_format="columns" the finished
+    file is converted to a columns folder (see RESULTS_FORMATS). metrics_log is an optional
+    MetricsLog for the per-position metrics and the summary of the file.
+    """
+    if mode not in EVALUATION_MODES:
+        raise ValueError(f"Unknown evaluation mode {mode!r}, expected one of {EVALUATION_MODES}")
+    if pool is None:
+        with EnginePool() as pool:
+            return process_fen_file(file_path, output_folder, pool, mode, cache, resume, search, results_format,
+                                    metrics_log)
+
+    logger.info(f"Processing FEN file: {file_path}")
+    fens = format_fens(file_path)
+    output_file = results_file_path(file_path, output_folder)
+    if resume and results_format == "columns":
+        finished = read_finished_columns(output_file, fens)
+        if finished is not None:
+            logger.info(f"{columns_path(output_file)} is already complete.")
+            finish_fen_file(finished, output_file)
+            return
+    writer = ResultsWriter(output_file, fens, resume)
+    try:
+        start = writer.next_index
+        analyse_chunk(pool, file_path, start, fens[start:], mode, cache, writer.add, search, metrics_log)
+    finally:
+        writer.close()
+    logger.info(f"Results saved to {output_file}.")
+    if metrics_log is not None:
+        metrics_log.summarize(file_path)
+    complete_results(writer, results_format)
+    finish_fen_file(writer.results, output_file)
+
+def compare_evaluation_modes(results_file, pool, num_moves=5, depth=20):
+    """Runs both evaluation modes on the positions of a results file and reports how far the statistics differ.
+
+    Each mode goes through the whole game under its own game key, so the engine gets a
+    ucinewgame (and a cleared hash) before it and the second mode does not start with
+    the hash the first one filled with the same positions.
+
+    Returns a list of (position number, two-phase statistics, multipv statistics).
+    """
+    fens = read_fens_from_results(results_file)
+    names = ("Variance", "Standard Deviation", "MAD", "IQR")
+    stats = {}
+    with pool.engine() as engine:
+        for mode in ("two-phase", "multipv"):
+            stats[mode] = []
+            for fen in fens:
+                evaluations, _ = analyse_position(chess.Board(fen), engine, mode=mode, num_moves=num_moves, depth=depth,
+                                                  game=f"{results_file} ({mode})")
+                scores = [evaluation for _, evaluation in evaluations if evaluation is not None]
+                stats[mode].append(compute_statistics(scores) if scores else None)
+    comparison = [(i + 1, a, b) for i, (a, b) in enumerate(zip(stats["two-phase"], stats["multipv"]))]
+
+    pairs = [(a, b) for _, a, b in comparison if a is not None and b is not None]
+    logger.info(f"Compared {len(pairs)} of {len(fens)} positions from {results_file}:")
+    for k, name in enumerate(names):
+        differences = np.abs([a[k] - b[k] for a, b in pairs]) if pairs else np.zeros(1)
+        logger.info(f"  {name}: mean |difference| {np.mean(differences):.2f}, max {np.max(differences):.2f}")
+    return comparison
+
+def iter_pgn_games(pgn_path):
+    """Yields (game key, output name, positions) for each game of a PGN file, one game at a time.
+
+    The positions are the boards after each move of the main line, with their move
+    stacks. The database is read lazily, so it can be much larger than memory. A
+    single-game PGN is named after the file, games of a database get their number
+    appended.
+    """
+    base_name = os.path.splitext(os.path.basename(pgn_path))[0]
+    with open(pgn_path, 'r', encoding='utf-8', errors='replace') as f:
+        game = chess.pgn.read_game(f)
+        next_game = chess.pgn.read_game(f) if game is not None else None
+        single_game = next_game is None
+        number = 1
+        while game is not None:
+            board = game.board()
+            positions = []
+            for move in game.mainline_moves():
+                board.push(move)
+                positions.append(board.copy())
+            name = base_name if single_game else f"{base_name} game {number}"
+            yield f"{pgn_path}#{number}", name, positions
+            game, next_game = next_game, chess.pgn.read_game(f) if next_game is not None else None
+            number += 1
+
+def iter_games(input_folder, chunk_size):
+    """Yields (game key, output name, positions, chunk size) for the games of every input file.
+
+    FEN text files are one game each and may be split into chunks of chunk_size
+    positions. PGN games are never split, so all their positions go to one engine.
+    """
+    for file_name in sorted(os.listdir(input_folder)):
+        input_file_path = os.path.join(input_folder, file_name)
+        base_name, extension = os.path.splitext(file_name)
+        if extension == '.txt':
+            yield input_file_path, base_name, format_fens(input_file_path), chunk_size
+        elif extension.lower() == '.pgn':
+            for game_key, name, positions in iter_pgn_games(input_file_path):
+                yield game_key, name, positions, max(1, len(positions))
 
-    # Optionally, plot statistics
-    plot_statistics(position_variance, position_sd, position_MAD, position_iqr)
+def engine_options(workers, thread_budget, hash_budget):
+    """Splits a global thread budget and hash budget (in MB) evenly over the engine workers.
 
-def process_batch_of_files(input_folder, output_folder):
-    """Processes all FEN text files in the input folder."""
+    Few workers give wide engines (many threads each, better for deep single searches);
+    many workers give narrow engines that keep more cores busy between positions.
+    """
+    if workers < 1:
+        raise ValueError("At least one engine worker is needed")
+    if workers > thread_budget:
+        raise ValueError(f"{workers} engine workers do not fit in a budget of {thread_budget} threads")
+    return {"Threads": thread_budget // workers, "Hash": max(1, hash_budget // workers)}
+
+def process_batch_of_files(input_folder, output_folder, mode="two-phase", workers=1,
+                           thread_budget=ENGINE_OPTIONS["Threads"], hash_budget=ENGINE_OPTIONS["Hash"],
+                           chunk_size=8, stockfish_path=STOCKFISH_PATH, cache=None, resume=False, search=None,
+                           plot=True, on_game_done=None, results_format="text", plots=None, metrics_log=None):
+    """Processes all FEN text files and PGN files in the input folder.
+
+    Games are read one at a time (see iter_games) and their positions are spread over
+    workers engines, each with its share of thread_budget and hash_budget. A chunk of
+    consecutive positions stays on one engine with the game as game= key, so the hash
+    is reused between its positions; FEN files are split into chunks of chunk_size,
+    PGN games are kept whole. Only a few chunks per engine are queued at a time, so
+    large PGN databases are streamed rather than loaded.
+    Rows are written as soon as all earlier positions of the same game are done, so
+    each _results.txt is in position order and does not depend on the scheduling.
+    With resume=True, files interrupted in an earlier run are continued.
+    mode, search and results_format are used as in process_fen_file.
+    When a game is complete, its statistics are plotted (unless plot=False, through the
+    chess_plots.PlotQueue plots if given) and on_game_done(name, results) is called
+    with its rows, on this thread.
+    With an EvaluationCache, the cache hits and misses of the batch are reported at the end.
+    With a MetricsLog, every position is recorded in it and each game is summarized when complete.
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    if mode not in EVALUATION_MODES:
+        raise ValueError(f"Unknown evaluation mode {mode!r}, expected one of {EVALUATION_MODES}")
+    if results_format not in RESULTS_FORMATS:
+        raise ValueError(f"Unknown results format {results_format!r}, expected one of {RESULTS_FORMATS}")
+    options = engine_options(workers, thread_budget, hash_budget)
     
-    # Get all .txt files in the input folder
-    fen_files = [f for f in os.listdir(input_folder) if f.endswith('.txt')]
+    logger.info(f"Processing games in {input_folder} with {workers} engine(s) of {options['Threads']} threads and {options['Hash']} MB hash.")
     
-    print(f"Found {len(fen_files)} FEN files to process.")
-    
-    # Process each FEN file
-    for fen_file in fen_files:
-        input_file_path = os.path.join(input_folder, fen_file)
-        process_fen_file(input_file_path, output_folder)
+    games = iter_games(input_folder, chunk_size)
+    queued_chunks = deque()
+    game_chunks = {}
+    writers = {}
+    game_names = {}
+    in_flight = {}
+    # Set on Ctrl-C or an error, so running chunks end after their current position and
+    # engines that die in the meantime are not restarted
+    stop = threading.Event()
+
+    def finish_game(game_key, results=None):
+        if results is None:
+            writer = writers.pop(game_key)
+            writer.close()
+            logger.info(f"Results saved to {writer.output_file}.")
+            complete_results(writer, results_format)
+            results = writer.results
+        if metrics_log is not None:
+            metrics_log.summarize(game_key)
+        name = game_names.pop(game_key)
+        if plot:
+            finish_fen_file(results, os.path.join(output_folder, f"{name}_results.txt"), plots)
+        if on_game_done is not None:
+            on_game_done(name, results)
+
+    def submit_chunks(executor, pool):
+        # Keep a couple of chunks per engine queued, reading the next game only when needed
+        while len(in_flight) < 2 * workers:
+            if not queued_chunks:
+                game = next(games, None)
+                if game is None:
+                    return
+                game_key, name, positions, size = game
+                fens = [position.fen() if isinstance(position, chess.Board) else position for position in positions]
+                output_file = os.path.join(output_folder, f"{name}_results.txt")
+                game_names[game_key] = name
+                if resume and results_format == "columns":
+                    finished = read_finished_columns(output_file, fens)
+                    if finished is not None:
+                        logger.info(f"{columns_path(output_file)} is already complete.")
+                        finish_game(game_key, finished)
+                        continue
+                writers[game_key] = ResultsWriter(output_file, fens, resume)
+                starts = range(writers[game_key].next_index, len(positions), size)
+                game_chunks[game_key] = len(starts)
+                if not starts:
+                    # Nothing (left) to analyse in this game
+                    finish_game(game_key)
+                queued_chunks.extend((game_key, start, positions[start:start + size]) for start in starts)
+                continue
+            game_key, start, positions = queued_chunks.popleft()
+            future = executor.submit(analyse_chunk, pool, game_key, start, positions, mode, cache, writers[game_key].add,
+                                     search, metrics_log, stop)
+            in_flight[future] = game_key
+
+    try:
+        # Engines are shared by the whole batch; plotting stays on this thread
+        with EnginePool(stockfish_path, size=workers, options=options, stop=stop) as pool:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            try:
+                submit_chunks(executor, pool)
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        game_key = in_flight.pop(future)
+                        future.result()
+                        game_chunks[game_key] -= 1
+                        if game_chunks[game_key] == 0:
+                            finish_game(game_key)
+                    submit_chunks(executor, pool)
+            finally:
+                # On Ctrl-C or an error, drop the chunks that have not started yet and let the
+                # running ones stop after their current position
+                stop.set()
+                executor.shutdown(cancel_futures=True)
+    finally:
+        # Whatever finished is already on disk and can be resumed
+        for writer in writers.values():
+            writer.close()
+
+    if cache is not None:
+        cache.report()
+        cache.reset_stats()
+
+@functools.lru_cache(maxsize=None)
+def load_analysis_module():
+    """Imports Chess data analysis.py from next to this script (its file name is not a valid module name)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Chess data analysis.py")
+    spec = importlib.util.spec_from_file_location("chess_data_analysis", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def results_to_metric_rows(results):
+    """Converts result rows to the row dicts that Chess data analysis.py works on."""
+    return [{"Position": pos_num, "Variance": float(spread), "IQR": float(iqr), "SD": float(std), "MAD": float(MAD)}
+            for pos_num, _, spread, std, MAD, iqr, _ in results]
+
+def run_pipeline(input_folder, output_folder, write_artifacts=False, on_critical_points=None, plots=None, **batch_options):
+    """Runs the engine statistics and the critical-point detection as one job.
+
+    Each game's critical points are found on its in-memory results as soon as the
+    game is complete, without reading _results.txt back. on_critical_points(name,
+    {metric: critical points}) is called for every game. The per-game statistics
+    plot and the critical-point text and PNG files (in analysis_results/, laid out
+    as by analyze_metrics_from_folder) are only written with write_artifacts=True.
+    The _results.txt files are always written, since resuming relies on them.
+    plots is an optional chess_plots.PlotQueue for rendering in a process pool or later.
+    batch_options are passed on to process_batch_of_files.
+    """
+    analysis = load_analysis_module()
+    analysis_folder = os.path.join(output_folder, "analysis_results")
+    critical_points_by_game = {}
+
+    def analyse_game(name, results):
+        output_dir = os.path.join(analysis_folder, f"analysis_results_{name}_results") if write_artifacts else None
+        critical_points = analysis.analyze_game_metrics(results_to_metric_rows(results), output_dir, name, plots)
+        critical_points_by_game[name] = critical_points
+        if on_critical_points is not None:
+            on_critical_points(name, critical_points)
+
+    process_batch_of_files(input_folder, output_folder, plot=write_artifacts, on_game_done=analyse_game, plots=plots,
+                           **batch_options)
+    return critical_points_by_game
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyse the positions of FEN and PGN files with Stockfish.")
     # Define the input folder containing FEN files and the output folder for results
-    input_folder = "C:/Users/kakaz/Documents/chess coding/Chess games"  # Replace with your folder containing input FEN files
-    output_folder = "C:/Users/kakaz/Documents/chess coding/Chess Gmases output"  # Replace with your desired output folder
-    
-    # Process the batch of FEN files
-    process_batch_of_files(input_folder, output_folder)
+    parser.add_argument("input_folder", nargs="?", default="C:/Users/kakaz/Documents/chess coding/Chess games",
+                        help="folder containing input FEN or PGN files")
+    parser.add_argument("output_folder", nargs="?", default="C:/Users/kakaz/Documents/chess coding/Chess Gmases output",
+                        help="folder for the _results.txt files")
+    parser.add_argument("--stockfish", default=STOCKFISH_PATH, help="path of the UCI engine binary")
+    parser.add_argument("--mode", choices=EVALUATION_MODES, default="two-phase")
+    parser.add_argument("--depth", type=int, default=DEFAULT_SEARCH["depth"])
+    parser.add_argument("--stable-iterations", type=int,
+                        help="adaptive mode: stop after this many depths with stable statistics (default 3)")
+    parser.add_argument("--tolerance", type=float,
+                        help="adaptive mode: largest change in centipawns that counts as stable (default 5)")
+    parser.add_argument("--nodes", type=int, help="adaptive mode: node budget per position")
+    parser.add_argument("--time-limit", type=float, help="adaptive mode: time budget per position in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="number of engine processes")
+    parser.add_argument("--threads", type=int, default=ENGINE_OPTIONS["Threads"], help="total engine threads")
+    parser.add_argument("--hash", type=int, default=ENGINE_OPTIONS["Hash"], help="total engine hash in MB")
+    parser.add_argument("--cache", help="SQLite file for cached evaluations")
+    parser.add_argument("--cache-max-entries", type=int,
+                        help="evict the least recently used cached evaluations beyond this many (unbounded by default)")
+    parser.add_argument("--resume", action="store_true", help="continue interrupted _results.txt files")
+    parser.add_argument("--format", choices=RESULTS_FORMATS, default="text", help="format of the finished results")
+    parser.add_argument("--critical-points", action="store_true",
+                        help="also find the critical points of every game (see run_pipeline)")
+    parser.add_argument("--no-artifacts", action="store_true", help="do not write plots and critical-point files")
+    parser.add_argument("--render", choices=chess_plots.RENDER_MODES, default="now",
+                        help="render plots right away, in a process pool, or only list them in --render-manifest")
+    parser.add_argument("--render-manifest", help="JSON lines file collecting the plots for --render later")
+    parser.add_argument("--metrics", help="JSON lines file for per-position engine metrics and per-game summaries")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO",
+                        help="DEBUG also shows every move and score")
+    parser.add_argument("--compare-modes", action="store_true",
+                        help="instead of analysing, compare the two-phase and multipv statistics on the positions "
+                             "of the _results.txt files in input_folder (e.g. Already done)")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(message)s", stream=sys.stdout)
+
+    if args.compare_modes:
+        results_files = sorted(name for name in os.listdir(args.input_folder) if name.endswith("_results.txt"))
+        with EnginePool(args.stockfish, options=engine_options(1, args.threads, args.hash)) as pool:
+            for name in results_files:
+                compare_evaluation_modes(os.path.join(args.input_folder, name), pool, depth=args.depth)
+        return
+
+    search = {"depth": args.depth}
+    # Only the settings given are added, so the cache keys of the other modes stay the same
+    for name in ("stable_iterations", "tolerance", "nodes", "time_limit"):
+        if getattr(args, name) is not None:
+            search[name] = getattr(args, name)
+    cache = EvaluationCache(args.cache, max_entries=args.cache_max_entries) if args.cache else None
+    metrics_log = MetricsLog(args.metrics, append=args.resume) if args.metrics else None
+    batch_options = dict(mode=args.mode, workers=args.workers, thread_budget=args.threads, hash_budget=args.hash,
+                         stockfish_path=args.stockfish, cache=cache, resume=args.resume, search=search,
+                         results_format=args.format, metrics_log=metrics_log)
+    plots = chess_plots.PlotQueue(args.render, manifest_path=args.render_manifest)
+    try:
+        # Process the batch of FEN and PGN files
+        if args.critical_points:
+            run_pipeline(args.input_folder, args.output_folder, write_artifacts=not args.no_artifacts, plots=plots,
+                         **batch_options)
+        else:
+            process_batch_of_files(args.input_folder, args.output_folder, plot=not args.no_artifacts, plots=plots,
+                                   **batch_options)
+    finally:
+        plots.close()
+        if cache is not None:
+            cache.close()
+        if metrics_log is not None:
+            metrics_log.close()
 
 if __name__ == "__main__":
     main()
- 
\ No newline at end of file
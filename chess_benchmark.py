@@ -0,0 +1,228 @@
+import argparse
+import contextlib
+import glob
+import importlib.util
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import chess
+import chess.engine
+
+# Offline benchmark of chess program copy.py. The FEN sequences behind the
+# Already done/*_results.txt files are replayed against fake_uci_engine.py, so a run
+# takes seconds, needs no Stockfish and gives the same scores every time.
+#
+#     python chess_benchmark.py --save baseline.json
+#     python chess_benchmark.py --baseline baseline.json
+#
+# The second run fails (exit status 1) if a metric got worse than the baseline by
+# more than --tolerance.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAKE_ENGINE = os.path.join(HERE, "fake_uci_engine.py")
+STAGES = ("search", "stats", "io", "plotting")
+
+def load_chess_program():
+    """Imports chess program copy.py (its file name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location("chess_program", os.path.join(HERE, "chess program copy.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def fake_engine_command(latency, startup=0.0):
+    return [sys.executable, FAKE_ENGINE, "--latency", str(latency), "--startup", str(startup)]
+
+def replay_games(program, folder, max_games=None, max_positions=None):
+    """Returns (name, FENs) for the _results.txt files in folder, optionally cut down."""
+    games = []
+    for file_path in sorted(glob.glob(os.path.join(folder, "*_results.txt")))[:max_games]:
+        name = os.path.basename(file_path)[:-len("_results.txt")]
+        games.append((name, program.read_fens_from_results(file_path)[:max_positions]))
+    return games
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the progress messages of the chess program (but not its warnings) while timing it."""
+    logging.disable(logging.INFO)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+def measure_engine_startup(command, options, repeats):
+    """Times starting, configuring and quitting an engine process, in milliseconds (means over repeats)."""
+    totals = {"spawn_ms": 0.0, "configure_ms": 0.0, "quit_ms": 0.0}
+    for _ in range(repeats):
+        started = time.perf_counter()
+        engine = chess.engine.SimpleEngine.popen_uci(command)
+        spawned = time.perf_counter()
+        engine.configure(options)
+        engine.ping()
+        configured = time.perf_counter()
+        engine.quit()
+        stopped = time.perf_counter()
+        totals["spawn_ms"] += 1000 * (spawned - started)
+        totals["configure_ms"] += 1000 * (configured - spawned)
+        totals["quit_ms"] += 1000 * (stopped - configured)
+    return {name: total / repeats for name, total in totals.items()}
+
+def measure_stages(program, games, command, mode, search, work_folder):
+    """Replays the games position by position on one engine, timing each stage separately.
+
+    search is the engine search (analyse_position), stats is compute_statistics, io is
+    writing the _results.txt rows and plotting is the per-game statistics plot, i.e.
+    the same steps as process_fen_file. Engine startup is not included.
+    """
+    search = dict(program.DEFAULT_SEARCH, **search)
+    seconds = dict.fromkeys(STAGES, 0.0)
+    positions = 0
+    with quiet(), program.EnginePool(command, options={"Threads": 1, "Hash": 16}) as pool:
+        with pool.engine() as engine:
+            engine.start()
+            for name, fens in games:
+                output_file = os.path.join(work_folder, f"{name}_results.txt")
+                writer = program.ResultsWriter(output_file, fens)
+                for i, fen in enumerate(fens):
+                    started = time.perf_counter()
+                    evaluations, depth = program.analyse_position(chess.Board(fen), engine, mode=mode, game=name, **search)
+                    searched = time.perf_counter()
+                    scores = [evaluation for _, evaluation in evaluations if evaluation is not None]
+                    row = (i + 1, fen, *program.compute_statistics(scores), depth) if scores else None
+                    computed = time.perf_counter()
+                    writer.add(i, row)
+                    written = time.perf_counter()
+                    seconds["search"] += searched - started
+                    seconds["stats"] += computed - searched
+                    seconds["io"] += written - computed
+                started = time.perf_counter()
+                writer.close()
+                written = time.perf_counter()
+                program.finish_fen_file(writer.results, output_file)
+                plotted = time.perf_counter()
+                seconds["io"] += written - started
+                seconds["plotting"] += plotted - written
+                positions += len(fens)
+    total = sum(seconds.values())
+    metrics = {"positions": positions, "positions_per_second": positions / total if total else 0.0}
+    for stage in STAGES:
+        metrics[f"{stage}_seconds"] = seconds[stage]
+        metrics[f"{stage}_ms_per_position"] = 1000 * seconds[stage] / positions if positions else 0.0
+    return metrics
+
+def measure_batch(program, games, command, mode, search, workers, work_folder):
+    """Times process_batch_of_files end to end (engine startup and plots included) on the games as FEN files."""
+    input_folder = os.path.join(work_folder, "input")
+    output_folder = os.path.join(work_folder, "output")
+    os.makedirs(input_folder)
+    for name, fens in games:
+        with open(os.path.join(input_folder, f"{name}.txt"), 'w') as f:
+            f.write("\n".join(fens))
+    positions = sum(len(fens) for _, fens in games)
+    started = time.perf_counter()
+    with quiet():
+        program.process_batch_of_files(input_folder, output_folder, mode=mode, workers=workers, thread_budget=workers,
+                                       hash_budget=16 * workers, stockfish_path=command, search=search)
+    elapsed = time.perf_counter() - started
+    return {"positions": positions, "seconds": elapsed, "positions_per_second": positions / elapsed}
+
+def run_benchmarks(program, args):
+    games = replay_games(program, args.games_folder, args.games, args.positions)
+    if not games:
+        raise SystemExit(f"No _results.txt files in {args.games_folder}")
+    command = fake_engine_command(args.latency, args.startup)
+    search = {"depth": args.depth}
+    metrics = {}
+    for name, value in measure_engine_startup(command, {"Threads": 1, "Hash": 16}, args.repeats).items():
+        metrics[f"engine.{name}"] = value
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as work_folder:
+            for name, value in measure_stages(program, games, command, mode, search, work_folder).items():
+                metrics[f"{mode}.stages.{name}"] = value
+        with tempfile.TemporaryDirectory() as work_folder:
+            for name, value in measure_batch(program, games, command, mode, search, args.workers, work_folder).items():
+                metrics[f"{mode}.batch.{name}"] = value
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "python_chess": chess.__version__, "cpu_count": os.cpu_count()},
+        "settings": {"games": [name for name, _ in games], "latency": args.latency, "startup": args.startup,
+                     "depth": args.depth, "modes": list(args.modes), "workers": args.workers},
+        "metrics": metrics,
+    }
+
+# Timings shorter than this (in seconds) are too noisy to flag as regressions
+NOISE_FLOOR = 0.05
+
+def find_regressions(report, baseline, tolerance):
+    """Returns (metric, baseline value, new value) for the metrics that got worse by more than tolerance (a fraction).
+
+    Rates (..._per_second) should not drop, times (..._seconds, ..._ms) should not grow.
+    The ..._ms_per_position figures only restate the stage totals and are not compared.
+    """
+    regressions = []
+    for name, old in baseline["metrics"].items():
+        new = report["metrics"].get(name)
+        if new is None or not old:
+            continue
+        if name.endswith("_per_second"):
+            worse = new < old * (1 - tolerance)
+        elif name.endswith("_seconds") or name.endswith("_ms"):
+            scale = 1000 if name.endswith("_ms") else 1
+            worse = new > old * (1 + tolerance) and max(old, new) / scale >= NOISE_FLOOR
+        else:
+            continue
+        if worse:
+            regressions.append((name, old, new))
+    return regressions
+
+def print_report(report):
+    for name, value in report["metrics"].items():
+        print(f"  {name}: {value:.3f}" if isinstance(value, float) else f"  {name}: {value}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chess program offline with a fake UCI engine.")
+    parser.add_argument("--games-folder", default=os.path.join(HERE, "Already done"),
+                        help="folder of _results.txt files whose FENs are replayed")
+    parser.add_argument("--games", type=int, help="replay only the first N games")
+    parser.add_argument("--positions", type=int, help="replay only the first N positions of each game")
+    parser.add_argument("--modes", nargs="+", default=["two-phase", "multipv"], help="evaluation modes to benchmark")
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds the fake engine spends per depth")
+    parser.add_argument("--startup", type=float, default=0.0, help="seconds the fake engine takes to start")
+    parser.add_argument("--workers", type=int, default=1, help="engine processes for the batch benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="engine starts to average for the startup timings")
+    parser.add_argument("--save", help="write the results to this JSON file, e.g. as a new baseline")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+    program = load_chess_program()
+    for mode in args.modes:
+        if mode not in program.EVALUATION_MODES:
+            parser.error(f"unknown evaluation mode {mode!r}")
+
+    report = run_benchmarks(program, args)
+    print("Benchmark results:")
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline["settings"] != report["settings"]:
+            print("Warning: the baseline was run with different settings, the comparison may not be meaningful.")
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print(f"Regression in {name}: {old:.3f} -> {new:.3f}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import matplotlib
+matplotlib.use("Agg")  # Batch runs only write PNG files; never open windows
+import matplotlib.pyplot as plt
+import numpy as np
+
+# Plot rendering shared by chess program copy.py and Chess data analysis.py.
+# It lives in its own module (with an importable name) so that render jobs can be
+# sent to worker processes on every platform.
+
+RENDER_MODES = ("now", "pool", "later")
+
+logger = logging.getLogger(__name__)
+
+class MetricPlotRenderer:
+    """Draws the metric-with-critical-points graph, reusing one figure and its artists for every plot."""
+
+    def __init__(self):
+        self.figure, self.axes = plt.subplots(figsize=(10, 6))
+        (self.line,) = self.axes.plot([], [], marker='o')
+        self.points = self.axes.scatter([], [], color='red', s=100, zorder=5)
+        self.axes.set_xlabel('Position')
+        self.axes.grid(True)
+
+    def render(self, metric_data, critical_points, metric, output_file):
+        positions = list(range(1, len(metric_data) + 1))
+        self.line.set_data(positions, metric_data)
+        self.line.set_label(f'{metric} values')
+
+        # Highlight the critical points
+        xs, ys = [], []
+        for idx, *values in critical_points:
+            xs.extend(range(idx + 1, idx + 1 + len(values)))
+            ys.extend(values)
+        self.points.set_offsets(np.column_stack([xs, ys]) if xs else np.empty((0, 2)))
+        # As before, the legend only lists the critical points when one starts at the first position
+        self.points.set_label('Critical Point' if any(idx == 0 for idx, *_ in critical_points) else '_nolegend_')
+
+        self.axes.set_title(f'{metric} and Critical Points')
+        self.axes.set_ylabel(f'{metric}')
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.axes.legend()
+        self.figure.savefig(output_file)
+
+class StatisticsPlotRenderer:
+    """Draws the 2x2 Variance/SD/MAD/IQR bar charts of one game, reusing one figure."""
+
+    TITLES = ('Variance', 'Standard Deviation', 'Mean Absolute Deviation', 'Interquartile Range')
+
+    def __init__(self):
+        self.figure, axes = plt.subplots(2, 2, figsize=(14, 10))
+        self.axes = axes.flatten()
+
+    def render(self, positions, series, output_file):
+        for axes, title, values in zip(self.axes, self.TITLES, series):
+            axes.cla()
+            axes.bar(positions, values)
+            axes.set_title(title)
+            axes.set_xlabel('Position')
+        self.figure.savefig(output_file)
+
+# One renderer of each kind per process, created on first use
+_renderers = {}
+
+def get_renderer(kind):
+    if kind not in _renderers:
+        _renderers[kind] = {"metric": MetricPlotRenderer, "statistics": StatisticsPlotRenderer}[kind]()
+    return _renderers[kind]
+
+def render_job(job):
+    """Renders one job: a dict with "kind" ("metric" or "statistics"), "output_file" and the plot data."""
+    if job["kind"] == "metric":
+        get_renderer("metric").render(job["metric_data"], job["critical_points"], job["metric"], job["output_file"])
+    else:
+        get_renderer("statistics").render(job["positions"], job["series"], job["output_file"])
+    return job["output_file"]
+
+def metric_job(metric_data, critical_points, metric, output_file):
+    return {"kind": "metric", "metric_data": np.asarray(metric_data, dtype=float).tolist(),
+            "critical_points": [[int(idx), *map(float, values)] for idx, *values in critical_points],
+            "metric": metric, "output_file": output_file}
+
+def statistics_job(positions, series, output_file):
+    return {"kind": "statistics", "positions": [int(position) for position in positions],
+            "series": [np.asarray(values, dtype=float).tolist() for values in series], "output_file": output_file}
+
+class PlotQueue:
+    """Collects plot jobs and renders them according to mode.
+
+    "now" renders on the calling thread with the reused figures, "pool" hands the jobs
+    to a process pool so the analysis is not blocked (at most a few jobs per process
+    are outstanding, so memory stays flat), and "later" only appends them to a JSON
+    lines manifest that render_manifest renders on request.
+    """
+
+    def __init__(self, mode="now", processes=None, manifest_path=None):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode {mode!r}, expected one of {RENDER_MODES}")
+        if mode == "later" and manifest_path is None:
+            raise ValueError("Rendering later needs a manifest path")
+        self.mode = mode
+        self.manifest_path = manifest_path
+        self.processes = processes or os.cpu_count() or 1
+        # Spawned rather than forked: the callers run engine and scheduler threads, and forking
+        # a multi-threaded process can deadlock the child
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")) \
+            if mode == "pool" else None
+        self.pending = set()
+
+    def submit(self, job):
+        if self.mode == "now":
+            logger.info(f"Graph saved to {render_job(job)}")
+        elif self.mode == "later":
+            with open(self.manifest_path, 'a') as f:
+                f.write(json.dumps(job) + "\n")
+        else:
+            while len(self.pending) >= 4 * self.processes:
+                self.collect(FIRST_COMPLETED)
+            self.pending.add(self.executor.submit(render_job, job))
+
+    def collect(self, return_when):
+        done, self.pending = wait(self.pending, return_when=return_when)
+        for future in done:
+            logger.info(f"Graph saved to {future.result()}")
+
+    def close(self):
+        """Waits for the outstanding jobs of a process pool."""
+        if self.executor is not None:
+            self.collect(ALL_COMPLETED)
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def render_manifest(manifest_path, processes=None):
+    """Renders the jobs deferred to a manifest by PlotQueue(mode="later")."""
+    with open(manifest_path, 'r') as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    logger.info(f"Rendering {len(jobs)} deferred plots from {manifest_path}...")
+    with PlotQueue("pool", processes) as plots:
+        for job in jobs:
+            plots.submit(job)
@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import sys
+import threading
+import time
+
+import chess
+
+# A stand-in for Stockfish for benchmarks and offline runs (see chess_benchmark.py).
+# It speaks enough UCI for python-chess: every legal move gets a deterministic score
+# derived from a hash of the position after it, so repeated runs give identical
+# results, and each depth iteration takes a configurable amount of time.
+#
+#     python fake_uci_engine.py --latency 0.002
+#
+# EnginePool accepts the command as a list, e.g. [sys.executable, "fake_uci_engine.py"].
+
+MAX_DEPTH = 64
+NODES_PER_DEPTH = 2000  # Nodes "searched" by the first depth; every further depth doubles it
+
+def position_score(board):
+    """Deterministic centipawn score of a position, from the point of view of the side to move."""
+    if board.is_checkmate():
+        return None
+    digest = hashlib.md5(board.epd().encode()).digest()
+    return int.from_bytes(digest[:4], "little") % 401 - 200
+
+def score_at_depth(score, depth):
+    """Makes the scores drift a little at low depths and settle as the depth grows, like a real search."""
+    return score + (score % 7 - 3) * 8 // depth
+
+class FakeEngine:
+    def __init__(self, latency, startup, nps):
+        self.latency = latency
+        self.startup = startup
+        self.nps = nps
+        self.options = {"Threads": 1, "Hash": 16, "MultiPV": 1}
+        self.board = chess.Board()
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        self.output_lock = threading.Lock()
+
+    def send(self, line):
+        with self.output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def uci(self):
+        time.sleep(self.startup)
+        self.send("id name FakeUCIEngine")
+        self.send("id author chess benchmark")
+        self.send("option name Threads type spin default 1 min 1 max 1024")
+        self.send("option name Hash type spin default 16 min 1 max 33554432")
+        self.send("option name MultiPV type spin default 1 min 1 max 500")
+        self.send("uciok")
+
+    def setoption(self, words):
+        # setoption name <name> value <value>; names may contain spaces
+        if "value" in words:
+            split = words.index("value")
+            name, value = " ".join(words[2:split]), " ".join(words[split + 1:])
+        else:
+            name, value = " ".join(words[2:]), None
+        if name in self.options and value is not None:
+            self.options[name] = int(value)
+
+    def position(self, words):
+        if words[1] == "startpos":
+            self.board = chess.Board()
+            rest = words[2:]
+        else:
+            self.board = chess.Board(" ".join(words[2:8]))
+            rest = words[8:]
+        if rest and rest[0] == "moves":
+            for move in rest[1:]:
+                self.board.push_uci(move)
+
+    def go(self, words):
+        limits = {}
+        for name in ("depth", "nodes", "movetime"):
+            if name in words:
+                limits[name] = int(words[words.index(name) + 1])
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=self.search, args=(self.board.copy(), limits))
+        self.search_thread.start()
+
+    def stop(self):
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def search(self, board, limits):
+        moves = list(board.legal_moves)
+        if not moves:
+            self.send("info depth 0 score mate 0" if board.is_checkmate() else "info depth 0 score cp 0")
+            self.send("bestmove (none)")
+            return
+
+        # Score every move from the side to move's point of view, best first
+        lines = []
+        for move in moves:
+            board.push(move)
+            score = position_score(board)
+            board.pop()
+            lines.append((move, None if score is None else -score))
+        lines.sort(key=lambda line: float("inf") if line[1] is None else line[1], reverse=True)
+        lines = lines[:self.options["MultiPV"]]
+
+        max_depth = limits.get("depth", MAX_DEPTH)
+        started = time.perf_counter()
+        nodes = 0
+        best = lines[0][0]
+        for depth in range(1, max_depth + 1):
+            if self.stop_event.wait(self.latency):
+                break
+            nodes += NODES_PER_DEPTH << min(depth - 1, 30)
+            elapsed_ms = max(1, int(1000 * (time.perf_counter() - started)))
+            hashfull = min(1000, nodes // (self.options["Hash"] * 64))
+            for k, (move, score) in enumerate(lines, 1):
+                if score is None:
+                    score_text = "mate 1"
+                else:
+                    score_text = f"cp {score_at_depth(score, depth)}"
+                self.send(f"info depth {depth} seldepth {depth + depth // 2} multipv {k} score {score_text} "
+                          f"nodes {nodes} nps {self.nps} hashfull {hashfull} time {elapsed_ms} pv {move.uci()}")
+            if nodes >= limits.get("nodes", float("inf")) or elapsed_ms >= limits.get("movetime", float("inf")):
+                break
+        self.send(f"bestmove {best.uci()}")
+
+    def run(self):
+        for line in sys.stdin:
+            words = line.split()
+            if not words:
+                continue
+            command = words[0]
+            if command == "uci":
+                self.uci()
+            elif command == "isready":
+                self.send("readyok")
+            elif command == "setoption":
+                self.setoption(words)
+            elif command == "ucinewgame":
+                self.board = chess.Board()
+            elif command == "position":
+                self.position(words)
+            elif command == "go":
+                self.go(words)
+            elif command == "stop":
+                self.stop()
+            elif command == "quit":
+                break
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic fake UCI engine for benchmarks.")
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds spent on every depth iteration")
+    parser.add_argument("--startup", type=float, default=0.0, help="seconds to wait before answering uci")
+    parser.add_argument("--nps", type=int, default=1_000_000, help="nodes per second to report")
+    args = parser.parse_args()
+    FakeEngine(args.latency, args.startup, args.nps).run()
+
+if __name__ == "__main__":
+    main()
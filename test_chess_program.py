@@ -0,0 +1,203 @@
+import importlib.util
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import chess
+
+# Checks of chess program copy.py. The ones that need an engine run on fake_uci_engine.py
+# instead of Stockfish, so no engine binary is needed. Run with pytest or directly:
+#
+#     python test_chess_program.py
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAKE_ENGINE = [sys.executable, os.path.join(HERE, "fake_uci_engine.py")]
+
+def load_program_module():
+    """Imports chess program copy.py (its file name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location("chess_program", os.path.join(HERE, "chess program copy.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+program = load_program_module()
+
+def game_fens(name="Opera Game", count=None):
+    fens = program.read_fens_from_results(os.path.join(HERE, "Already done", f"{name}_results.txt"))
+    return fens[:count]
+
+def write_fen_file(folder, name, fens):
+    path = os.path.join(folder, f"{name}.txt")
+    with open(path, 'w') as f:
+        f.write("\n".join(fens) + "\n")
+    return path
+
+# Runs a batch on two fake engines that take 0.05 s per depth, i.e. 1 s per MultiPV search.
+# At DEBUG level python-chess logs the commands sent to the engines.
+INTERRUPTED_BATCH = """
+import importlib.util, logging, sys
+logging.basicConfig(level=logging.DEBUG, format="%(message)s", stream=sys.stdout)
+spec = importlib.util.spec_from_file_location("chess_program", sys.argv[1])
+program = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(program)
+program.process_batch_of_files(sys.argv[2], sys.argv[3], mode="multipv", workers=2, thread_budget=2, hash_budget=16,
+                               chunk_size=4, stockfish_path=[sys.executable, sys.argv[4], "--latency", "0.05"], plot=False)
+"""
+
+def test_ctrl_c_lets_engines_finish_their_position():
+    if os.name != "posix":
+        return  # sends SIGINT to a process group, as a terminal does on Ctrl-C
+    with tempfile.TemporaryDirectory() as folder:
+        input_folder, output_folder = os.path.join(folder, "in"), os.path.join(folder, "out")
+        os.makedirs(input_folder)
+        write_fen_file(input_folder, "Opera Game", game_fens())
+        batch = subprocess.Popen([sys.executable, "-c", INTERRUPTED_BATCH, os.path.join(HERE, "chess program copy.py"),
+                                  input_folder, output_folder, FAKE_ENGINE[1]],
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, start_new_session=True)
+        output = []
+        # Interrupt once both engines are searching
+        while sum("<< go" in line for line in output) < 2:
+            line = batch.stdout.readline()
+            assert line, "".join(output)
+            output.append(line)
+        os.killpg(batch.pid, signal.SIGINT)
+        interrupted = time.perf_counter()
+        output.append(batch.stdout.read())
+        batch.wait()
+        output = "".join(output)
+        assert batch.returncode != 0, output
+        assert "restarting" not in output, output
+        # Both running positions were finished by their engines, no further ones were started
+        assert time.perf_counter() - interrupted < 3, output
+        assert output.count("Processing position") == 2, output
+        with open(os.path.join(output_folder, "Opera Game_results.txt")) as f:
+            assert len(f.readlines()) == 1 + 1, output  # position 1; position 5 waits for 2-4
+
+# Fool's mate: the side to move has no moves, so the position produces no row
+MATED = "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3"
+
+def resumed_run(folder, fens, partial_lines, pool):
+    """
+    Writes partial_lines as the _results.txt file of fens, resumes it, and returns the
+    lines of the finished file and the numbers of the positions that were searched.
+    """
+    input_file = write_fen_file(folder, "game", fens)
+    output_folder = os.path.join(folder, "out")
+    os.makedirs(output_folder, exist_ok=True)
+    output_file = program.results_file_path(input_file, output_folder)
+    if partial_lines is not None:
+        with open(output_file, 'w') as f:
+            f.writelines(partial_lines)
+    metrics_log = program.MetricsLog(os.path.join(folder, "metrics.jsonl"))
+    program.process_fen_file(input_file, output_folder, pool=pool, mode="multipv", resume=True, metrics_log=metrics_log)
+    metrics_log.close()
+    with open(output_file) as f:
+        lines = f.readlines()
+    with open(metrics_log.path) as f:
+        searched = [record["position"] for record in map(json.loads, f) if record["type"] == "position"]
+    return lines, searched
+
+def test_resume_matches_uninterrupted_run():
+    fens = game_fens(count=5) + [MATED] + game_fens("Karpov Kasparov", 4)
+    with program.EnginePool(FAKE_ENGINE) as pool:
+        with tempfile.TemporaryDirectory() as folder:
+            complete, searched = resumed_run(folder, fens, None, pool)
+        assert complete[0] == program.RESULTS_HEADER
+        assert [program.parse_result_row(line)[0] for line in complete[1:]] == [1, 2, 3, 4, 5, 7, 8, 9, 10]
+        assert searched == list(range(1, 11))
+
+        def resume(partial_lines):
+            with tempfile.TemporaryDirectory() as folder:
+                lines, searched = resumed_run(folder, fens, partial_lines, pool)
+            assert lines == complete
+            return searched
+
+        # Interrupted after position 3, and while writing the row of position 4
+        assert resume(complete[:4]) == list(range(4, 11))
+        assert resume(complete[:4] + [complete[4][:20]]) == list(range(4, 11))
+        # Position 6 had no row; position 7 was the last one written
+        assert resume(complete[:7]) == [8, 9, 10]
+        # Nothing written but the header
+        assert resume(complete[:1]) == list(range(1, 11))
+        # The input file changed since: position 2 of the partial file is another FEN
+        changed = program.parse_result_row(complete[2])
+        changed = program.format_result_row(changed[:1] + (fens[7],) + changed[2:])
+        assert resume(complete[:2] + [changed] + complete[3:4]) == list(range(1, 11))
+        # A results file of the old format without the Depth column is started again
+        with open(os.path.join(HERE, "Already done", "Opera Game_results.txt")) as f:
+            old_lines = f.readlines()
+        assert not old_lines[0].strip().endswith("Depth")
+        assert resume(old_lines[:4]) == list(range(1, 11))
+
+def test_results_writer_keeps_position_order():
+    fens = game_fens(count=5)
+    rows = [(i + 1, fen, 1.0, 2.0, 3.0, 4.0, 20) for i, fen in enumerate(fens)]
+    with tempfile.TemporaryDirectory() as folder:
+        output_file = os.path.join(folder, "game_results.txt")
+
+        def written():
+            with open(output_file) as f:
+                return f.readlines()[1:]
+
+        writer = program.ResultsWriter(output_file, fens)
+        writer.add(2, rows[2])
+        writer.add(1, None)
+        assert written() == []
+        writer.add(0, rows[0])
+        assert written() == [program.format_result_row(rows[0]), program.format_result_row(rows[2])]
+        writer.add(4, rows[4])
+        writer.close()
+        assert writer.results == [rows[0], rows[2]] and writer.next_index == 3
+
+        # Resuming continues after the last written row; position 4 is done again
+        writer = program.ResultsWriter(output_file, fens, resume=True)
+        assert writer.next_index == 3 and writer.results == [rows[0], rows[2]]
+        writer.add(3, rows[3])
+        writer.add(4, rows[4])
+        writer.close()
+        assert written() == [program.format_result_row(row) for row in (rows[0], rows[2], rows[3], rows[4])]
+
+def test_cache_evicts_least_recently_used():
+    def evaluations(uci):
+        return [(chess.Move.from_uci(uci), 25)]
+
+    def later():
+        time.sleep(0.02)  # distinct last_used times, also with a coarse clock
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "cache.db")
+        cache = program.EvaluationCache(path, max_entries=2)
+        cache.put("a", evaluations("e2e4"), 20)
+        later()
+        cache.put("b", evaluations("d2d4"), 20)
+        later()
+        assert cache.get("a") == (evaluations("e2e4"), 20)  # a is now used more recently than b
+        later()
+        cache.put("c", evaluations("c2c4"), 20)
+        assert cache.get("b") is None
+        assert (cache.size, cache.evictions, cache.hits, cache.misses) == (2, 1, 1, 1)
+        later()
+        # Replacing an entry does not add one
+        cache.put("a", evaluations("g1f3"), 22)
+        assert cache.get("a") == (evaluations("g1f3"), 22)
+        assert (cache.size, cache.evictions) == (2, 1)
+        cache.close()
+
+        cache = program.EvaluationCache(path, max_entries=2)
+        assert cache.size == 2
+        later()
+        cache.put("d", evaluations("b2b3"), 20)
+        assert cache.get("c") is None and cache.get("a") is not None and cache.get("d") is not None
+        assert (cache.size, cache.evictions) == (2, 1)
+        assert cache.connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0] == 2
+        cache.close()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")
@@ -0,0 +1,71 @@
+import glob
+import importlib.util
+import os
+import random
+
+import numpy as np
+
+# Checks that find_critical_points_many of Chess data analysis.py gives exactly the
+# triples of find_critical_points, on random series (including ties, plateaus and values
+# of very different sizes) and on the games in Already done/. Run with pytest or directly:
+#
+#     python test_critical_points.py
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_analysis_module():
+    """Imports Chess data analysis.py (its file name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location("chess_data_analysis", os.path.join(HERE, "Chess data analysis.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+analysis = load_analysis_module()
+
+def random_series(seed, count=3000):
+    rng = random.Random(seed)
+    series = []
+    for g in range(count):
+        length = rng.randint(0, 60)
+        if g % 3 == 0:
+            values = [rng.random() * 100 for _ in range(length)]
+        elif g % 3 == 1:
+            values = [float(rng.choice([0, 10, 20, 30, 40, 50])) for _ in range(length)]
+        else:
+            values = [float(rng.randint(0, 5) * rng.choice([1, 3, 7, 1e-8, 1e8])) for _ in range(length)]
+        series.append(values)
+    return series
+
+def test_ragged_series_match_find_critical_points():
+    series = random_series(1)
+    found = analysis.find_critical_points_many({"A": series})["A"]
+    for g, values in enumerate(series):
+        assert found[g] == analysis.find_critical_points(values), g
+
+def test_array_of_games_matches_find_critical_points():
+    values = np.array([series[:20] for series in random_series(2) if len(series) >= 20])
+    found = analysis.find_critical_points_many({"A": values})["A"]
+    for g in range(len(values)):
+        assert found[g] == analysis.find_critical_points(list(values[g])), g
+
+def test_longer_windows_match_scalar_check():
+    series = random_series(3)
+    for window in (4, 5):
+        found = analysis.find_critical_points_many({"A": series}, window=window)["A"]
+        for g, values in enumerate(series):
+            expected = [i for i in range(len(values) - window + 1) if analysis.is_critical_window(values, i, window)]
+            assert [point[0] for point in found[g]] == expected, (g, window)
+
+def test_already_done_games():
+    games = [analysis.read_data_from_file(path) for path in sorted(glob.glob(os.path.join(HERE, "Already done", "*_results.txt")))]
+    for metric in analysis.METRICS:
+        series = [[row[metric] for row in game] for game in games]
+        found = analysis.find_critical_points_many({metric: series})[metric]
+        for g, values in enumerate(series):
+            assert found[g] == analysis.find_critical_points(values), (metric, g)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")